@@ -0,0 +1,93 @@
+"""Performance benchmarks, run as modules, e.g. python -m benchmarks.stats_indexes"""
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from memorizer.application import create_app
+from memorizer.database import db
+from memorizer import models
+from memorizer.synthetic import add_students
+
+CONFIG_FILENAME = 'benchmark_config.py'
+
+
+def create_benchmark_app(directory, **config):
+    """Creates an app backed by a fresh SQLite database in directory"""
+    settings = {
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(directory, 'benchmark.db'),
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'SECRET_KEY': 'benchmark',
+        'TESTING': True,
+    }
+    settings.update(config)
+    config_path = os.path.join(directory, CONFIG_FILENAME)
+    with open(config_path, 'w') as file:
+        for key, value in settings.items():
+            file.write('{} = {!r}\n'.format(key, value))
+    app = create_app(config_path)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def temporary_directory():
+    return tempfile.TemporaryDirectory(prefix='memorizer-benchmark-')
+
+
+def seed(courses=10, exams=10, questions=50, alternatives=4, users=1000, stats=100000, rng=None):
+    """Bulk inserts synthetic rows, returns the ids of the users and questions"""
+    rng = rng or random.Random(0)
+
+    def insert(model, rows):
+        db.session.execute(model.__table__.insert(), rows)
+
+    insert(models.Course, [{'id': c, 'code': 'C%04d' % c, 'name': 'Course %d' % c} for c in range(1, courses + 1)])
+    insert(models.Exam, [
+        {'id': (c - 1) * exams + e, 'name': 'V%02d' % e, 'course_id': c, 'multiple_correct': False, 'hidden': False}
+        for c in range(1, courses + 1) for e in range(1, exams + 1)
+    ])
+    question_ids = list(range(1, courses * exams * questions + 1))
+    insert(models.Question, [
+        {'id': q, 'text': 'Question %d' % q, 'image': '', 'exam_id': (q - 1) // questions + 1,
+         'reason': None, 'type': models.Question.MULTIPLE, 'correct': None}
+        for q in question_ids
+    ])
+    insert(models.Alternative, [
+        {'text': 'Alternative %d' % a, 'correct': a == 0, 'question_id': q}
+        for q in question_ids for a in range(alternatives)
+    ])
+    # Answers are spread over a few courses per user, like real students
+    per_course = exams * questions
+    user_ids, _ = add_students(
+        {c: question_ids[(c - 1) * per_course:c * per_course] for c in range(1, courses + 1)}, users, stats, rng
+    )
+    db.session.commit()
+    return user_ids, question_ids
+
+
+def measure(function, iterations):
+    """Calls function iterations times, returns the mean time in milliseconds"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - start) * 1000 / iterations
+
+
+def timings(function, iterations, warmup=10):
+    """Calls function warmup + iterations times, returns statistics of the timed calls in milliseconds"""
+    for _ in range(warmup):
+        function()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'iterations': iterations,
+        'mean_ms': statistics.mean(samples),
+        'median_ms': statistics.median(samples),
+        'p95_ms': samples[min(int(iterations * 0.95), iterations - 1)],
+    }
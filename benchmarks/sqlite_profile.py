@@ -0,0 +1,104 @@
+"""Read/write concurrency of SQLite with its defaults and with the SQLITE_PRAGMAS profile
+
+    python -m benchmarks.sqlite_profile --workers 8 --seconds 10
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import time
+
+from flask import g
+from sqlalchemy.exc import OperationalError
+
+from memorizer import config, models, utils
+from memorizer.application import create_app
+from memorizer.database import db
+
+from benchmarks import CONFIG_FILENAME, create_benchmark_app, seed, temporary_directory
+
+
+def worker(directory, seconds, write_ratio, worker_seed, results):
+    """Answers and reads stats until time is up, like one server process"""
+    app = create_app(os.path.join(directory, CONFIG_FILENAME))
+    rng = random.Random(worker_seed)
+    counts = {'reads': 0, 'writes': 0, 'errors': 0}
+    latencies = []
+    with app.test_request_context():
+        user_ids = [user_id for user_id, in db.session.query(models.User.id)]
+        question_ids = [question_id for question_id, in db.session.query(models.Question.id)]
+        course_codes = [code for code, in db.session.query(models.Course.code)]
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            user = db.session.get(models.User, rng.choice(user_ids))
+            start = time.perf_counter()
+            try:
+                if rng.random() < write_ratio:
+                    question = db.session.get(models.Question, rng.choice(question_ids))
+                    models.Stats.record(user, question, rng.random() < 0.7)
+                    db.session.commit()
+                    counts['writes'] += 1
+                else:
+                    g.user = user
+                    utils.generate_stats(rng.choice(course_codes))
+                    db.session.rollback()
+                    counts['reads'] += 1
+            except OperationalError:
+                # database is locked
+                db.session.rollback()
+                counts['errors'] += 1
+            latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    counts['p99_ms'] = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0
+    results.put(counts)
+
+
+def run(pragmas, args):
+    with temporary_directory() as directory:
+        app = create_benchmark_app(directory, SQLITE_PRAGMAS=pragmas)
+        with app.app_context():
+            seed(users=args.users, stats=args.stats)
+            db.engine.dispose()
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        processes = [
+            context.Process(target=worker, args=(directory, args.seconds, args.write_ratio, i, results))
+            for i in range(args.workers)
+        ]
+        for process in processes:
+            process.start()
+        counts = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+    return {
+        'reads_per_second': sum(count['reads'] for count in counts) / args.seconds,
+        'writes_per_second': sum(count['writes'] for count in counts) / args.seconds,
+        'locked_errors': sum(count['errors'] for count in counts),
+        'worst_worker_p99_ms': max(count['p99_ms'] for count in counts),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=8, help='Concurrent processes')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--write-ratio', type=float, default=0.3, help='Share of requests answering a question')
+    parser.add_argument('--stats', type=int, default=200000, help='Stats rows to seed')
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    before = run({}, args)
+    after = run(config.SQLITE_PRAGMAS, args)
+
+    if args.json:
+        print(json.dumps({'before': before, 'after': after}, indent=2))
+        return
+    print('{:<24}{:>12}{:>12}'.format('', 'defaults', 'profile'))
+    for name in before:
+        print('{:<24}{:>12.1f}{:>12.1f}'.format(name, before[name], after[name]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Times the hot-path lookups with and without the indexes from migration 3c9e5b7a1f42
+
+    python -m benchmarks.stats_indexes --stats 1000000
+"""
+import argparse
+import json
+import random
+
+from flask import g
+
+from memorizer import models, utils
+from memorizer.database import db
+from memorizer.views.api import correct_alternatives
+
+from benchmarks import create_benchmark_app, measure, seed, temporary_directory
+
+INDEXES = {
+    'ix_exam_course_id', 'ix_question_exam_id', 'ix_alternative_question_id',
+    'ix_stats_question_id', 'ix_stats_user_id_reset_question_id',
+}
+
+
+def hot_paths(user_ids, question_ids, rng):
+    def generate_stats():
+        g.user = db.session.get(models.User, rng.choice(user_ids))
+        course = db.session.get(models.Course, rng.randint(1, 10))
+        utils.generate_stats(course.code)
+
+    def answered():
+        user = db.session.get(models.User, rng.choice(user_ids))
+        question = db.session.get(models.Question, rng.choice(question_ids))
+        models.Stats.answered(user, question)
+
+    def alternatives():
+        correct_alternatives(db.session.get(models.Question, rng.choice(question_ids)))
+
+    def exam_questions():
+        models.Question.query.filter_by(exam_id=rng.randint(1, 100)).all()
+
+    return {
+        'generate_stats': generate_stats,
+        'stats_answered': answered,
+        'correct_alternatives': alternatives,
+        'exam_questions': exam_questions,
+    }
+
+
+def run(paths, iterations):
+    return {name: measure(function, iterations) for name, function in paths.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stats', type=int, default=1000000, help='Stats rows to seed')
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    with temporary_directory() as directory:
+        app = create_benchmark_app(directory)
+        with app.test_request_context():
+            user_ids, question_ids = seed(users=args.users, stats=args.stats)
+            indexes = [
+                index for table in db.metadata.tables.values()
+                for index in table.indexes if index.name in INDEXES
+            ]
+            for index in indexes:
+                index.drop(db.engine)
+            before = run(hot_paths(user_ids, question_ids, random.Random(1)), args.iterations)
+            for index in indexes:
+                index.create(db.engine)
+            db.session.execute(db.text('ANALYZE'))
+            after = run(hot_paths(user_ids, question_ids, random.Random(1)), args.iterations)
+
+    if args.json:
+        print(json.dumps({'before': before, 'after': after}, indent=2))
+        return
+    print('{:<24}{:>12}{:>12}{:>10}'.format('ms per call', 'before', 'after', 'speedup'))
+    for name in before:
+        print('{:<24}{:>12.3f}{:>12.3f}{:>9.1f}x'.format(name, before[name], after[name], before[name] / after[name]))
+
+
+if __name__ == '__main__':
+    main()
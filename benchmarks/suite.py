@@ -0,0 +1,168 @@
+"""Times the hot paths on the bundled questions/ corpus and simulated students
+
+    python -m benchmarks.suite --json > results.json
+    python -m benchmarks.suite --baseline results.json
+
+With --baseline the run fails when a median got slower than the tolerance allows.
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+
+from flask import g, url_for
+
+from memorizer import importer, models, utils
+from memorizer.cache import cache
+from memorizer.config import PROJECT_PATH
+from memorizer.database import db
+from memorizer.load import outside_context
+from memorizer.synthetic import add_students
+
+from benchmarks import create_benchmark_app, temporary_directory, timings
+
+CORPUS = os.path.join(PROJECT_PATH, 'questions', '*.json')
+
+
+def import_corpus(pattern=CORPUS):
+    """Imports every valid exam file, returns the number of files"""
+    exams = []
+    for exam_json, error in map(importer.load_exam, sorted(glob.glob(pattern))):
+        if error:
+            print('Skipping', error, file=sys.stderr)
+        else:
+            exams.append(exam_json)
+    importer.import_exams(exams, bulk=True, validate=False)
+    return len(exams)
+
+
+def simulate_students(users, answers, rng):
+    """Adds users who answered questions in a few courses each, returns the user ids"""
+    courses = {}
+    for course_code, question_id in db.session.query(models.Course.code, models.Question.id)\
+            .join(models.Exam, models.Exam.course_id == models.Course.id)\
+            .join(models.Question, models.Question.exam_id == models.Exam.id):
+        courses.setdefault(course_code, []).append(question_id)
+    user_ids, _ = add_students(dict(sorted(courses.items())), users, users * answers, rng, reset_share=0)
+    db.session.commit()
+    return user_ids
+
+
+def hot_paths(app, user_ids, rng):
+    courses = [course.code for course in models.Course.query.order_by(models.Course.id)]
+    question_ids = [question_id for question_id, in db.session.query(models.Question.id)]
+    client = app.test_client()
+    # Built up front, the requests themselves run outside the benchmark's contexts like behind a server
+    bundle_urls = {code: url_for('api.course_questions', course=code) for code in courses}
+    question_urls = {code: url_for('quiz.question_course', course_code=code, id=1) for code in courses}
+    answer_url = url_for('api.answer')
+
+    def as_student():
+        # The helpers find the user through g
+        g.user = db.session.get(models.User, rng.choice(user_ids))
+
+    def log_in():
+        # Requests find the user through the session cookie
+        with client.session_transaction() as session:
+            session['user'] = rng.choice(user_ids)
+
+    def random_id():
+        as_student()
+        utils.random_id(course=rng.choice(courses))
+
+    def generate_stats():
+        as_student()
+        utils.generate_stats(rng.choice(courses))
+
+    def course_question():
+        course = models.Course.query.filter_by(code=rng.choice(courses)).one()
+        course.question(rng.randint(1, course.question_count))
+
+    def course_bundle():
+        outside_context(client.get, bundle_urls[rng.choice(courses)])
+
+    def api_answer():
+        log_in()
+        outside_context(client.post, answer_url, data={'question': rng.choice(question_ids), 'correct': 'true'})
+
+    def quiz_question():
+        log_in()
+        outside_context(client.get, question_urls[rng.choice(courses)])
+
+    def quiz_answer():
+        log_in()
+        outside_context(client.post, question_urls[rng.choice(courses)], data={'answer': 'true'})
+
+    return {
+        'utils.random_id': random_id,
+        'utils.generate_stats': generate_stats,
+        'Course.question': course_question,
+        'GET /api/questions/<course>/all/': course_bundle,
+        'POST /api/answer': api_answer,
+        'GET quiz question': quiz_question,
+        'POST quiz question': quiz_answer,
+    }
+
+
+def regressions(results, baseline, tolerance):
+    """Names of the benchmarks with a median more than tolerance slower than in baseline"""
+    return [
+        name for name, result in results.items()
+        if name in baseline and result['median_ms'] > baseline[name]['median_ms'] * (1 + tolerance)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--answers', type=int, default=100, help='Answers per simulated user')
+    parser.add_argument('--iterations', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed slowdown of medians, 0.25 is 25%%')
+    args = parser.parse_args()
+
+    with temporary_directory() as directory:
+        app = create_benchmark_app(directory, SERVER_NAME='localhost')
+        with app.app_context():
+            files = import_corpus()
+            user_ids = simulate_students(args.users, args.answers, random.Random(args.seed))
+            meta = {
+                'python': platform.python_version(),
+                'sqlite': sqlite3.sqlite_version,
+                'files': files,
+                'questions': models.Question.query.count(),
+                'users': len(user_ids),
+                'stats': models.Stats.query.count(),
+            }
+            results = {}
+            with app.test_request_context():
+                paths = hot_paths(app, user_ids, random.Random(args.seed))
+            for name, function in paths.items():
+                cache.clear()
+                with app.test_request_context():
+                    results[name] = timings(function, args.iterations)
+
+    if args.json:
+        print(json.dumps({'meta': meta, 'results': results}, indent=2, sort_keys=True))
+    else:
+        print('{questions} questions from {files} files, {users} users, {stats} answers'.format(**meta))
+        print('{:<36}{:>12}{:>12}{:>12}'.format('ms per call', 'mean', 'median', 'p95'))
+        for name, result in results.items():
+            print('{:<36}{mean_ms:>12.3f}{median_ms:>12.3f}{p95_ms:>12.3f}'.format(name, **result))
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)['results']
+        slower = regressions(results, baseline, args.tolerance)
+        if slower:
+            sys.exit('Slower than the baseline: ' + ', '.join(slower))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""Write-behind buffering of answers
+
+With ANSWER_BUFFER on, answers are queued in memory and saved by a background
+thread, many in one transaction, instead of one commit per answer. Answers
+still queued when the process dies are lost: at most ANSWER_BUFFER_MAX of them,
+and normally no more than one flush interval's worth. Past ANSWER_BUFFER_MAX
+answers are saved right away again.
+"""
+import atexit
+import logging
+import threading
+from collections import namedtuple
+
+from memorizer import models
+from memorizer.database import db
+
+logger = logging.getLogger(__name__)
+
+PendingAnswer = namedtuple('PendingAnswer', 'user_id question_id correct course_code exam_name')
+
+
+class AnswerBuffer(object):
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        self.pending = []
+        # (user_id, question_id) of the pending answers
+        self.keys = set()
+        self.lock = threading.Lock()
+        # Only one flush at a time, answers must be saved in order
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('ANSWER_BUFFER', False)
+        self.interval = app.config.get('ANSWER_BUFFER_FLUSH_MS', 200) / 1000
+        self.batch_size = app.config.get('ANSWER_BUFFER_SIZE', 100)
+        self.max_pending = app.config.get('ANSWER_BUFFER_MAX', 5000)
+
+    def add(self, user, question, correct):
+        """Queues an answer, returns False if the question had already been answered"""
+        answer = PendingAnswer(user.id, question.id, correct, question.course.code, question.exam.name)
+        key = (user.id, question.id)
+        if key in self.keys or models.Stats.answered(user, question):
+            return False
+        with self.lock:
+            if key in self.keys:
+                return False
+            if len(self.pending) >= self.max_pending:
+                full = True
+            else:
+                full = False
+                self.pending.append(answer)
+                self.keys.add(key)
+                if len(self.pending) >= self.batch_size:
+                    self.wakeup.set()
+        if full:
+            # Falling behind, don't risk losing more
+            first = models.Stats.record(user, question, correct)
+            db.session.commit()
+            return first
+        self._start()
+        return True
+
+    def answers(self, user_id, course_code, exam_name=None):
+        """Whether the pending answers of a user in a course or exam are correct, oldest first"""
+        with self.lock:
+            return [
+                answer.correct for answer in self.pending
+                if answer.user_id == user_id and answer.course_code == course_code
+                and (exam_name is None or answer.exam_name == exam_name)
+            ]
+
+    def flush(self):
+        """Saves the pending answers in one transaction"""
+        with self.flush_lock:
+            with self.lock:
+                batch = list(self.pending)
+            if not batch:
+                return
+            with self.app.app_context():
+                try:
+                    models.Stats.record_many(
+                        {'user_id': answer.user_id, 'question_id': answer.question_id, 'correct': answer.correct}
+                        for answer in batch
+                    )
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    # A single bad answer mustn't hold up all the others
+                    logger.exception('Saving %d buffered answers failed, saving them one at a time', len(batch))
+                    self._record_each(batch)
+            # Until now they have been counted as pending
+            with self.lock:
+                del self.pending[:len(batch)]
+                self.keys.difference_update((answer.user_id, answer.question_id) for answer in batch)
+
+    def _record_each(self, batch):
+        """Saves the answers one transaction each, dropping those that can't be saved"""
+        for answer in batch:
+            user = db.session.get(models.User, answer.user_id)
+            question = db.session.get(models.Question, answer.question_id)
+            if user is None or question is None:
+                logger.error('Dropped the buffered answer of user %s to question %s, which no longer exist',
+                             answer.user_id, answer.question_id)
+                continue
+            try:
+                models.Stats.record(user, question, answer.correct)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                logger.exception('Dropped the buffered answer of user %s to question %s',
+                                 answer.user_id, answer.question_id)
+
+    def _start(self):
+        # Started on first use, so forked workers each get their own thread
+        if self.thread is not None:
+            return
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='answer-buffer', daemon=True)
+                self.thread.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            self.flush()
+
+
+answer_buffer = AnswerBuffer()
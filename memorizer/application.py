@@ -7,23 +7,33 @@ from flask_migrate import Migrate
 from flask.cli import FlaskGroup
 from werkzeug.middleware.proxy_fix import ProxyFix
 
+from memorizer.answer_buffer import answer_buffer
+from memorizer.bundles import build_snapshots
 from memorizer.cache import cache
 from memorizer.importer import import_questions
+from memorizer.load import load
 from memorizer.make_admin import AdminCommand
+from memorizer.metrics import metrics
+from memorizer.synthetic import generate_synthetic
 from memorizer.user import get_user
 from memorizer.utils import datetimeformat, grade, percentage
 from memorizer.views.admin import admin
 from memorizer.views.api import api
 from memorizer.views.quiz import quiz
-from memorizer.database import db
+from memorizer.database import add_read_bind, configure_engines, db, size_pool
 
 
 def create_app(config_filename='config.py'):
     app = Flask(__name__)
     app.config.from_pyfile(config_filename)
     app.wsgi_app = ProxyFix(app.wsgi_app)
+    add_read_bind(app.config)
+    size_pool(app.config)
     db.init_app(app)
+    configure_engines(app)
     cache.init_app(app)
+    answer_buffer.init_app(app)
+    metrics.init_app(app)
     migrate.init_app(app, db)
     assets.init_app(app)
 
@@ -54,7 +64,10 @@ js = Bundle(
     'js/ajax.js', 'js/collapse.js', 'js/alert.js', 'js/api.js', 'js/sidebar.js',
     'js/filter.js', filters='jsmin', output='js/min.%(version)s.js'
 )
-admin_js = Bundle('js/admin.js', 'js/question_form.js', filters='jsmin', output='js/admin.min.%(version)s.js')
+admin_js = Bundle(
+    'js/admin.js', 'js/question_form.js', 'js/history.js',
+    filters='jsmin', output='js/admin.min.%(version)s.js'
+)
 app_js = Bundle('js/template.js', 'js/questions.js', filters='jsmin', output='js/app.min.%(version)s.js')
 css = Bundle(
     'css/font-awesome.min.css', 'css/styles.css', 'css/admin.css',
@@ -74,11 +87,10 @@ mail_handler = SMTPHandler(
 mail_handler.setLevel(logging.ERROR)
 
 cli = FlaskGroup(create_app=create_app)
-
-
-@cli.command('import')
-def import_data():
-    import_questions()
+cli.add_command(import_questions, 'import')
+cli.add_command(build_snapshots, 'snapshots')
+cli.add_command(generate_synthetic, 'synthetic')
+cli.add_command(load, 'load')
 
 
 @cli.command('admin')
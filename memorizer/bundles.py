@@ -0,0 +1,215 @@
+"""Question bundles for the quiz client, and gzipped snapshots of them on disk
+
+Snapshots are written under a name holding their ETag, and a small pointer file
+names the current one, so readers never see a partial file or a wrong ETag even
+with several workers writing. A changed course has its snapshots removed at once
+and built again in the background, bundles are built per request until then.
+"""
+import glob
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import click
+from flask import current_app, has_request_context, request, send_file
+from flask.cli import with_appcontext
+
+from memorizer import models, serializers
+from memorizer.config import CACHE_TIME
+
+logger = logging.getLogger(__name__)
+
+
+def questions(course, exam=None, public=False):
+    """Serialized questions of a course, or of one of its exams, public ones as seen by students"""
+    context = serializers.Context() if public else serializers.request_context()
+    query = models.Question.serializable()
+    if exam:
+        query = query.filter_by(exam_id=exam.id)
+    else:
+        exams = models.Exam.query.filter_by(course_id=course.id)
+        if public:
+            exams = exams.filter(models.Exam.hidden.is_(False))
+        query = query.filter(models.Question.exam_id.in_(exams.with_entities(models.Exam.id)))
+    serialized_objects = [serializers.question(question_m, context) for question_m in query]
+    return [obj for obj in serialized_objects if obj is not None]
+
+
+def snapshot_path(course_code, exam_name=None):
+    """Path of the snapshot pointer file, None if snapshots are disabled"""
+    directory = current_app.config.get('SNAPSHOT_DIR')
+    if not directory:
+        return None
+    # Course codes and exam names are not necessarily safe file names
+    name = hashlib.sha1(json.dumps([course_code, exam_name]).encode()).hexdigest()
+    return os.path.join(directory, name + '.etag')
+
+
+def _content_path(path, etag):
+    return '{}.{}.json.gz'.format(path[:-len('.etag')], etag)
+
+
+def _write(path, data):
+    # A temporary file of its own per writer, renamed into place when complete
+    descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.snapshot-')
+    try:
+        with os.fdopen(descriptor, 'wb') as file:
+            file.write(data)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def _remove(path, keep=None):
+    """Removes the pointer and the snapshot files, except the one of etag keep"""
+    filenames = glob.glob(_content_path(path, '*'))
+    if keep is None:
+        filenames.append(path)
+    for filename in filenames:
+        if filename != _content_path(path, keep):
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+
+
+def build_snapshot(course_code, exam_name=None):
+    """Writes the public bundle of a course or exam to disk, returns its ETag"""
+    path = snapshot_path(course_code, exam_name)
+    if not path:
+        return None
+    course = models.Course.query.filter_by(code=course_code).first()
+    exam = None
+    if course and exam_name:
+        exam = models.Exam.query.filter_by(course=course, name=exam_name).first()
+    if not course or (exam_name and (not exam or exam.hidden)):
+        _remove(path)
+        return None
+    if has_request_context():
+        payload = json.dumps(questions(course, exam, public=True))
+    else:
+        # Image urls are built with url_for
+        with current_app.test_request_context():
+            payload = json.dumps(questions(course, exam, public=True))
+    payload = payload.encode()
+    etag = hashlib.sha256(payload).hexdigest()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Content before the pointer, and content files are named by their ETag,
+    # so a pointer always names complete content matching its ETag
+    _write(_content_path(path, etag), gzip.compress(payload, mtime=0))
+    _write(path, etag.encode())
+    _remove(path, keep=etag)
+    return etag
+
+
+def rebuild_snapshots(course_code, exam_names=()):
+    """Rebuilds the course snapshot and the given exam snapshots after a change"""
+    build_snapshot(course_code)
+    for exam_name in exam_names:
+        build_snapshot(course_code, exam_name)
+
+
+def remove_snapshots(course_code, exam_names=()):
+    for exam_name in (None,) + tuple(exam_names):
+        path = snapshot_path(course_code, exam_name)
+        if path:
+            _remove(path)
+
+
+def schedule_rebuild(course_code, exam_names=()):
+    """Rebuilds snapshots after a change, in the background during requests when SNAPSHOT_BACKGROUND is on"""
+    if not current_app.config.get('SNAPSHOT_DIR'):
+        return
+    if not (has_request_context() and current_app.config.get('SNAPSHOT_BACKGROUND', False)):
+        rebuild_snapshots(course_code, exam_names)
+        return
+    # Stale snapshots must not be served while the new ones are being built
+    remove_snapshots(course_code, exam_names)
+    snapshot_builder.add(current_app._get_current_object(), course_code, exam_names)
+
+
+class SnapshotBuilder(object):
+    """Builds snapshots from a background thread, each course and exam once however often it changed"""
+
+    def __init__(self):
+        # (app, course_code, exam_name)
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def add(self, app, course_code, exam_names=()):
+        with self.lock:
+            for exam_name in (None,) + tuple(exam_names):
+                self.pending.add((app, course_code, exam_name))
+        self._start()
+        self.wakeup.set()
+
+    def build(self):
+        """Builds the pending snapshots"""
+        with self.lock:
+            batch, self.pending = self.pending, set()
+        for app, course_code, exam_name in batch:
+            with app.app_context():
+                try:
+                    build_snapshot(course_code, exam_name)
+                except Exception:
+                    logger.exception('Building the snapshot of %s %s failed', course_code, exam_name or '')
+                finally:
+                    models.db.session.remove()
+
+    def _start(self):
+        if self.thread is not None:
+            return
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='snapshot-builder', daemon=True)
+                self.thread.start()
+
+    def _run(self):
+        while True:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            self.build()
+
+
+snapshot_builder = SnapshotBuilder()
+
+
+def send_snapshot(course_code, exam_name=None):
+    """Serves a snapshot file as is, returns None if there is none to serve"""
+    path = snapshot_path(course_code, exam_name)
+    if not path or 'gzip' not in request.accept_encodings:
+        return None
+    try:
+        # Bounds how long changes made behind the app's back, e.g. in the database, go unseen
+        if time.time() - os.stat(path).st_mtime > current_app.config.get('SNAPSHOT_MAX_AGE', CACHE_TIME):
+            schedule_rebuild(course_code, [exam_name] if exam_name else [])
+            return None
+        with open(path) as file:
+            etag = file.read()
+        # Answers If-None-Match itself and lets the server use sendfile
+        response = send_file(_content_path(path, etag), mimetype='application/json', etag=etag, conditional=True)
+    except OSError:
+        # Not built yet, or replaced by a newer one in between
+        return None
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+@click.command()
+@with_appcontext
+def build_snapshots():
+    """Build question bundle snapshots for every course and exam"""
+    if not current_app.config.get('SNAPSHOT_DIR'):
+        raise click.ClickException('Snapshots are disabled, set SNAPSHOT_DIR to use them')
+    for course in models.Course.query.all():
+        rebuild_snapshots(course.code, [exam.name for exam in course.exams])
+        print('Built snapshots for', course.code)
@@ -1,9 +1,76 @@
+from datetime import datetime, timezone
+from functools import wraps
+from time import time
+from uuid import uuid4
+
 from flask_caching import Cache
 
-from memorizer.config import CACHE_REDIS_URL, CACHE_TYPE
+from memorizer.config import CACHE_REDIS_URL, CACHE_TIME, CACHE_TYPE
 
 cache = Cache(config={
     'CACHE_TYPE': CACHE_TYPE,
     'CACHE_KEY_PREFIX': 'memorizer',
     'CACHE_REDIS_URL': CACHE_REDIS_URL
 })
+# Outlives the entries keyed on a generation. A full SimpleCache prunes the entries
+# expiring first, and never expiring ones before all others
+GENERATION_TIMEOUT = 2 * CACHE_TIME
+
+
+def _generation_key(scope):
+    return 'generation/' + '/'.join(str(part) for part in scope)
+
+
+def generation(*scope, create=True):
+    """Token for the current contents of a scope, e.g. ('course', 'TDT4100')
+
+    Without create, None if the scope has no token yet instead of starting one.
+    """
+    token = cache.get(_generation_key(scope))
+    if token is None and create:
+        token = invalidate(*scope)
+    return token
+
+
+def invalidate(*scope):
+    """Makes every entry keyed on the generation of the scope stale"""
+    # Random tokens, so an evicted generation can never bring back old entries,
+    # prefixed with the time to double as a modification date
+    token = '%x.%s' % (int(time()), uuid4().hex)
+    cache.set(_generation_key(scope), token, timeout=GENERATION_TIMEOUT)
+    return token
+
+
+def generation_time(token):
+    """When a generation token was made, as an aware UTC datetime"""
+    return datetime.fromtimestamp(int(token.split('.')[0], 16), timezone.utc)
+
+
+def course_generation(course_code, exam_name=None, create=True):
+    if exam_name:
+        return generation('exam', course_code, exam_name, create=create)
+    return generation('course', course_code, create=create)
+
+
+def invalidate_course(course_code, exam_names=()):
+    """Invalidates the course wide data of a course and the given exams in it"""
+    for exam_name in exam_names:
+        invalidate('exam', course_code, exam_name)
+    invalidate('course', course_code)
+
+
+def memoize_course(timeout=None):
+    """Memoizes a function of (course_code, exam_name) until that course or exam is invalidated"""
+    def decorator(f):
+        def versioned(generation, *args):
+            return f(*args)
+        # Same cache key namespace as memoizing f directly
+        versioned.__module__ = f.__module__
+        versioned.__qualname__ = f.__qualname__
+        versioned = cache.memoize(timeout)(versioned)
+
+        @wraps(f)
+        def decorated_function(*args):
+            return versioned(course_generation(*args), *args)
+        return decorated_function
+    return decorator
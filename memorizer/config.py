@@ -10,6 +10,29 @@ PERMAMENT_SESSION_LIFETIME = timedelta(days=60)  # around two months
 
 SQLALCHEMY_DATABASE_URI = 'sqlite:///' + join(PROJECT_PATH, 'memorizer.db')
 SQLALCHEMY_TRACK_MODIFICATIONS = False
+# Run on every new SQLite connection, set to {} to keep SQLite's defaults
+SQLITE_PRAGMAS = {
+    # Readers and the writer don't block each other
+    'journal_mode': 'WAL',
+    # Safe with WAL, only the last commits may be lost on power failure
+    'synchronous': 'NORMAL',
+    # Wait for the write lock instead of failing with "database is locked"
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # in KiB when negative
+    'temp_store': 'MEMORY',
+}
+# Queries of GET requests go to the 'read' engine when there is one, e.g. a replica
+SQLALCHEMY_BINDS = {}
+# Without a 'read' bind, use a read-only connection to the SQLite file of
+# SQLALCHEMY_DATABASE_URI as the read engine
+SQLITE_READ_ENGINE = True
+SQLALCHEMY_ENGINE_OPTIONS = {
+    # Connections are cheap, but keeping them keeps the page cache warm.
+    # Left out for in-memory SQLite, which has a single connection
+    'pool_size': 10,
+    'max_overflow': 20,
+}
 
 # Cache
 CACHE_TIME = 60 * 60 * 2  # 2 hours, pretty arbitrary
@@ -17,6 +40,31 @@ CACHE_TYPE = 'simple'
 # If redis is used
 CACHE_REDIS_URL = 'redis://localhost:6379'
 
+# Save answers in batches from a background thread, losing at most
+# ANSWER_BUFFER_MAX of them if the process dies
+ANSWER_BUFFER = False
+ANSWER_BUFFER_FLUSH_MS = 200
+ANSWER_BUFFER_SIZE = 100  # flush early when this many are waiting
+ANSWER_BUFFER_MAX = 5000
+
+# Count queries and time requests, served per endpoint on /metrics
+METRICS = False
+# Send each response's query count and timings in X-Query-Count and Server-Timing
+METRICS_HEADERS = False
+# Who may read /metrics: these addresses, as seen through ProxyFix, or anyone
+# sending "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_ALLOWED_IPS = ('127.0.0.1', '::1')
+METRICS_TOKEN = None
+
+# Pre-built question bundles, e.g. join(PROJECT_PATH, 'snapshots'), built by
+# flask snapshots and after changes made through the app. None builds them per request
+SNAPSHOT_DIR = None
+# Rebuild after changes from a background thread instead of in the request
+SNAPSHOT_BACKGROUND = True
+# Snapshots older than this are built again, bounding how long changes made
+# outside the app, e.g. in the database, go unseen
+SNAPSHOT_MAX_AGE = CACHE_TIME
+
 try:
     from memorizer.localconfig import *  # NOQA
 except ImportError:
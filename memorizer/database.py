@@ -1,11 +1,38 @@
+from flask import has_request_context, request
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
 from sqlalchemy_continuum import make_versioned
-from sqlalchemy_continuum.plugins import FlaskPlugin
+from sqlalchemy_continuum.plugins import FlaskPlugin, TransactionMetaPlugin
 from sqlalchemy_utils import force_auto_coercion
 
 from memorizer.user import get_user
 
-db = SQLAlchemy()
+# Bind key of an optional read-only engine, e.g. a replica, in SQLALCHEMY_BINDS
+READ_BIND = 'read'
+# PRAGMAs changing the database file rather than the connection, not run on the read engine
+PERSISTENT_PRAGMAS = ('journal_mode', 'auto_vacuum', 'page_size')
+# Engine options only a pool of several connections takes
+POOL_SIZING = ('pool_size', 'max_overflow', 'pool_timeout')
+
+
+class RoutingSession(Session):
+    """Sends the queries of GET requests to the read engine, when there is one"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and READ_BIND in self._db.engines and self._reading(clause):
+            return self._db.engines[READ_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _reading(self, clause):
+        # GET handlers may write too, e.g. resetting stats, those stay on the primary
+        if self._flushing or (clause is not None and getattr(clause, 'is_dml', False)):
+            return False
+        return has_request_context() and request.method in ('GET', 'HEAD')
+
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 force_auto_coercion()
 
@@ -17,4 +44,78 @@ def fetch_current_user_id():
     return getattr(user, 'id', None)
 
 
-make_versioned(plugins=[FlaskPlugin(current_user_id_factory=fetch_current_user_id)])
+# Transaction meta describes changes not versioned row by row, like unversioned imports
+make_versioned(plugins=[FlaskPlugin(current_user_id_factory=fetch_current_user_id), TransactionMetaPlugin()])
+
+
+def configure_engines(app):
+    """Applies SQLITE_PRAGMAS to the engines db.init_app made for an app"""
+    pragmas = app.config.get('SQLITE_PRAGMAS') or {}
+    # The read engine serves the primary's tables and has none of its own. Its
+    # metadata would make create_all and drop_all of every later app look for it
+    db.metadatas.pop(READ_BIND, None)
+    with app.app_context():
+        for key, engine in db.engines.items():
+            if key == READ_BIND:
+                # A read-only connection can't write the file, e.g. switch it to WAL
+                configure_sqlite(engine, {
+                    name: value for name, value in pragmas.items() if name not in PERSISTENT_PRAGMAS
+                })
+            else:
+                configure_sqlite(engine, pragmas)
+        primary = db.engines.get(None)
+        if READ_BIND in db.engines and primary is not None and primary.dialect.name == 'sqlite':
+            # Creates the file and sets its journal mode before the read engine opens it
+            with primary.connect():
+                pass
+
+
+def configure_sqlite(engine, pragmas):
+    """Runs PRAGMA name = value for the pragmas on every new connection of a SQLite engine"""
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute('PRAGMA %s = %s' % (name, value))
+        cursor.close()
+
+
+def add_read_bind(config):
+    """Adds a read-only connection to the SQLite file of SQLALCHEMY_DATABASE_URI as the read engine
+
+    Only with SQLITE_READ_ENGINE on and no read engine configured already, and not for in-memory
+    databases, which other connections can't open.
+    """
+    uri = config.get('SQLALCHEMY_DATABASE_URI')
+    binds = config.get('SQLALCHEMY_BINDS') or {}
+    if not (uri and config.get('SQLITE_READ_ENGINE', False)) or READ_BIND in binds:
+        return
+    url = make_url(uri)
+    if url.get_backend_name() != 'sqlite' or url.database in (None, '', ':memory:'):
+        return
+    if url.query.get('mode') == 'memory':
+        return
+    if not url.query.get('uri'):
+        url = url.set(database='file:' + url.database).update_query_dict({'uri': 'true'})
+    config['SQLALCHEMY_BINDS'] = dict(binds, **{
+        READ_BIND: url.update_query_dict({'mode': 'ro'}).render_as_string(hide_password=False)
+    })
+
+
+def size_pool(config):
+    """Drops the pool sizing from SQLALCHEMY_ENGINE_OPTIONS for an in-memory SQLite database
+
+    Its single connection is kept in a StaticPool, which rejects the sizing options.
+    """
+    uri = config.get('SQLALCHEMY_DATABASE_URI')
+    if not uri:
+        return
+    url = make_url(uri)
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            key: value for key, value in config.get('SQLALCHEMY_ENGINE_OPTIONS', {}).items()
+            if key not in POOL_SIZING
+        }
@@ -0,0 +1,48 @@
+"""Version history of the versioned models, a page at a time"""
+from sqlalchemy import orm
+from sqlalchemy_continuum import version_class, versioning_manager
+
+from memorizer.utils import datetimeformat
+
+PAGE_SIZE = 10
+
+
+def versions(obj, before=None, limit=PAGE_SIZE):
+    """Newest versions of obj older than transaction id before, with their numbers
+
+    Returns [(number, version)] and the before of the next page, None on the last page.
+    Transactions and users are loaded with the versions, changesets are not.
+    """
+    version_cls = version_class(obj.__class__)
+    query = version_cls.query.filter(version_cls.id == obj.id)
+    if before is not None:
+        query = query.filter(version_cls.transaction_id < before)
+    # Number of the newest version on the page
+    count = query.count()
+    page = query.options(
+        orm.joinedload(version_cls.transaction).joinedload(versioning_manager.transaction_cls.user)
+    ).order_by(version_cls.transaction_id.desc()).limit(limit).all()
+    next_before = page[-1].transaction_id if count > limit else None
+    return [(count - i, version) for i, version in enumerate(page)], next_before
+
+
+def serialize(number, version):
+    transaction = version.transaction
+    return {
+        'number': number,
+        'transaction_id': version.transaction_id,
+        'issued_at': datetimeformat(transaction.issued_at),
+        'user': transaction.user.username if transaction.user else None,
+    }
+
+
+def changeset(model, object_id, transaction_id):
+    """Changes made to an object in a transaction as [field, before, after], None if there's no such version"""
+    version_cls = version_class(model)
+    version = version_cls.query.filter_by(id=object_id, transaction_id=transaction_id).first()
+    if version is None:
+        return None
+    return [
+        [field] + ['' if value is None else str(value) for value in values]
+        for field, values in version.changeset.items()
+    ]
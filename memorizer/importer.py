@@ -1,7 +1,17 @@
 import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
 import click
+from flask.cli import with_appcontext
+from sqlalchemy_continuum import version_class, versioning_manager
+from sqlalchemy_continuum.operation import Operation
 
 from memorizer import models
+from memorizer.bundles import schedule_rebuild
+from memorizer.cache import invalidate, invalidate_course
 from memorizer.database import db
 
 
@@ -9,7 +19,16 @@ class ValidationError(Exception):
     pass
 
 
+def alternative_correct(question, number):
+    if type(question['correct']) is int and question['correct'] == number:
+        return True
+    elif type(question['correct']) is list and number in question['correct']:
+        return True
+    return False
+
+
 def import_question(question, exam):
+    """Adds a question and its alternatives to the session, returns the number of rows"""
     image = question.get('image', '')
     if 'answers' in question:
         question_type = models.Question.MULTIPLE
@@ -19,40 +38,125 @@ def import_question(question, exam):
         answer = question['answer']
     question_object = models.Question(question_type, question['question'], exam.id, image, answer)
     db.session.add(question_object)
-    db.session.commit()
     if question_type != models.Question.MULTIPLE:
-        return
+        return 1
     for number, answer in enumerate(question['answers']):
-        if type(question['correct']) is int and question['correct'] == number:
-            correct = True
-        elif type(question['correct']) is list and number in question['correct']:
-            correct = True
+        correct = alternative_correct(question, number)
+        # Inserted together with the question when the session is flushed
+        question_object.alternatives.append(models.Alternative(answer, correct))
+    return 1 + len(question['answers'])
+
+
+def bulk_import_questions(questions, exam):
+    """Inserts questions and alternatives with executemany-style statements, returns the number of rows"""
+    question_rows = [{
+        'text': question['question'],
+        'image': question.get('image', ''),
+        'exam_id': exam.id,
+        'reason': None,
+        'type': models.Question.MULTIPLE if 'answers' in question else models.Question.BOOLEAN,
+        'correct': question.get('answer'),
+    } for question in questions]
+    question_ids = _bulk_insert(models.Question, question_rows)
+    alternative_rows = [
+        {'text': answer, 'correct': alternative_correct(question, number), 'question_id': question_id}
+        for question, question_id in zip(questions, question_ids) if 'answers' in question
+        for number, answer in enumerate(question['answers'])
+    ]
+    if alternative_rows:
+        _bulk_insert(models.Alternative, alternative_rows)
+    return len(question_rows) + len(alternative_rows)
+
+
+def _bulk_insert(model, rows):
+    """Inserts rows of a versioned model along with their version rows, returns the new ids"""
+    table = model.__table__
+    ids = db.session.execute(
+        table.insert().returning(table.c.id, sort_by_parameter_order=True), rows
+    ).scalars().all()
+    if not versioning_manager.options['versioning']:
+        return ids
+    # Core inserts bypass SQLAlchemy-Continuum, so history is written here
+    uow = versioning_manager.unit_of_work(db.session())
+    transaction = uow.current_transaction or uow.create_transaction(db.session())
+    db.session.execute(version_class(model).__table__.insert(), [
+        dict(row, id=id, transaction_id=transaction.id, operation_type=Operation.INSERT)
+        for row, id in zip(rows, ids)
+    ])
+    return ids
+
+
+def import_exam(exam_json, commit=True, bulk=False, validate=True):
+    """Imports an exam in a single transaction, returns the number of rows inserted"""
+    if validate:
+        # Will raise exception if error found
+        validate_exam(exam_json)
+    try:
+        # Get or create course
+        course = models.Course.query.filter_by(code=exam_json['code']).first()
+        if not course:
+            course = models.Course(exam_json['code'], exam_json['name'])
+            db.session.add(course)
+            db.session.flush()
+        # Get or create exam
+        exam = models.Exam.query.filter_by(name=exam_json['exam'], course=course).first()
+        if not exam:
+            exam = models.Exam(exam_json['exam'], course.id)
+            db.session.add(exam)
+            db.session.flush()
+        if bulk:
+            rows = bulk_import_questions(exam_json['questions'], exam)
         else:
-            correct = False
-        alternative = models.Alternative(answer, correct, question_object.id)
-        db.session.add(alternative)
-    db.session.commit()
-
-
-def import_exam(exam_json):
-    # Will raise exception if error found
-    validate_exam(exam_json)
-    # Get or create course
-    course = models.Course.query.filter_by(code=exam_json['code']).first()
-    if not course:
-        course = models.Course(exam_json['code'], exam_json['name'])
-        db.session.add(course)
-        db.session.commit()
-    # Get or create exam
-    exam = models.Exam.query.filter_by(name=exam_json['exam'], course=course).first()
-    if not exam:
-        exam = models.Exam(exam_json['exam'], course.id)
-        db.session.add(exam)
+            rows = 0
+            for question_json in exam_json['questions']:
+                rows += import_question(question_json, exam)
+        if commit:
+            db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    if commit:
+        invalidate_course(exam_json['code'], [exam_json['exam']])
+        invalidate('api')
+        schedule_rebuild(exam_json['code'], [exam_json['exam']])
+    return rows
+
+
+def import_exams(exams, bulk=False, validate=True):
+    """Imports several exams in a single transaction, returns the number of rows inserted"""
+    rows = 0
+    try:
+        for exam_json in exams:
+            rows += import_exam(exam_json, commit=False, bulk=bulk, validate=validate)
         db.session.commit()
-    questions = exam_json['questions']
-    for question_json in questions:
-        import_question(question_json, exam)
-    return True
+    except Exception:
+        db.session.rollback()
+        raise
+    touched = {}
+    for exam_json in exams:
+        touched.setdefault(exam_json['code'], []).append(exam_json['exam'])
+    for course_code, exam_names in touched.items():
+        invalidate_course(course_code, exam_names)
+        schedule_rebuild(course_code, exam_names)
+    invalidate('api')
+    return rows
+
+
+@contextmanager
+def unversioned_import(description):
+    """Writes no history row by row, only one transaction with description as its meta
+
+    Versioning is switched off for the whole process, so this is meant for the cli.
+    """
+    session = db.session()
+    uow = versioning_manager.unit_of_work(session)
+    transaction = uow.current_transaction or uow.create_transaction(session)
+    transaction.meta = {'description': description}
+    versioning_manager.options['versioning'] = False
+    try:
+        yield transaction
+    finally:
+        versioning_manager.options['versioning'] = True
 
 
 def validate_exam(exam_json):
@@ -87,6 +191,8 @@ def validate_questions(exam_json):
         raise ValidationError('Det må være minst et spørsmål')
     questions = exam_json['questions']
     for question in questions:
+        if type(question) is not dict:
+            raise ValidationError('Spørsmål må være objekter: {!r}'.format(question))
         try:
             validate_question(question)
         except ValidationError as e:
@@ -147,16 +253,59 @@ def validate_question(question):
         raise ValidationError('Svar mangler')
 
 
+def load_exam(filename):
+    """Parses and validates an exam file, returns the exam and an error message"""
+    try:
+        with open(filename) as file:
+            exam_json = json.load(file)
+        validate_exam(exam_json)
+    except (OSError, ValueError, TypeError, ValidationError) as e:
+        return None, '{}: {}'.format(filename, e)
+    return exam_json, None
+
+
 @click.command()
-@click.argument('filenames', nargs=-1, type=click.File('r'))
-def import_questions(filenames):
+@click.argument('filenames', nargs=-1, type=click.Path(exists=True, dir_okay=False))
+@click.option('--bulk', is_flag=True, help='Import all files in a single transaction with batched inserts.')
+@click.option('--jobs', '-j', default=1, show_default=True, help='Processes used to parse and validate files.')
+@click.option('--unversioned', is_flag=True,
+              help='Record one history transaction for the import instead of history for every row. '
+                   'Imports all files in a single transaction.')
+@with_appcontext
+def import_questions(filenames, bulk, jobs, unversioned):
     """Import questions in JSON format"""
     print("Importing questions...")
-    for file in filenames:
-        exam_json = json.load(file)
+    start = time.perf_counter()
+    # Everything is parsed and validated before anything is written
+    if jobs > 1:
+        with ProcessPoolExecutor(jobs) as executor:
+            loaded = list(executor.map(load_exam, filenames))
+    else:
+        loaded = list(map(load_exam, filenames))
+    errors = [error for exam_json, error in loaded if error]
+    if errors:
+        for error in errors:
+            print(error)
+        raise click.ClickException('{} of {} files are invalid, nothing was imported'.format(
+            len(errors), len(filenames)
+        ))
+    exams = [exam_json for exam_json, error in loaded]
+    for exam_json in exams:
         print('Importing questions from', exam_json['name'], exam_json['code'], 'exam', exam_json['exam'])
-        import_exam(exam_json)
-    print("Importing completed")
+    rows = 0
+    if unversioned:
+        description = 'Imported ' + ', '.join(os.path.basename(filename) for filename in filenames)
+        with unversioned_import(description):
+            rows = import_exams(exams, bulk=bulk, validate=False)
+    elif bulk:
+        rows = import_exams(exams, bulk=True, validate=False)
+    else:
+        for exam_json in exams:
+            rows += import_exam(exam_json, validate=False)
+    elapsed = time.perf_counter() - start
+    print("Importing completed: {} rows in {:.2f}s ({:.0f} rows/s)".format(
+        rows, elapsed, rows / elapsed if elapsed else 0
+    ))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,192 @@
+"""Drives the app with concurrent simulated students and reports throughput and latency"""
+import contextvars
+import json
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, build_opener
+
+import click
+from flask import current_app, url_for
+from flask.cli import with_appcontext
+
+from memorizer import models
+
+# Questions a student answers in a course before picking another one
+QUESTIONS_PER_COURSE = 10
+PERCENTILES = (50, 95, 99)
+
+
+def outside_context(function, *args, **kwargs):
+    """Calls function with no app or request context pushed, like a server does for every request
+
+    The test client reuses an app context that is already pushed, and with it g and db.session.
+    """
+    return contextvars.Context().run(function, *args, **kwargs)
+
+
+class WSGIClient:
+    """Calls the app in process, without a server in between"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        response = outside_context(self.client.open, path, method=method, data=data)
+        return response.status_code, response.get_data()
+
+
+class HTTPClient:
+    """Calls a running server, keeping the session cookie like a browser"""
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        self.opener = build_opener(HTTPCookieProcessor(CookieJar()))
+
+    def request(self, method, path, data=None):
+        body = urlencode(data).encode() if data is not None else None
+        try:
+            with self.opener.open(self.url + path, data=body, timeout=60) as response:
+                return response.status, response.read()
+        except HTTPError as e:
+            return e.code, e.read()
+
+
+class Results:
+    """Latencies and errors per endpoint, shared by the students"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(Counter)
+
+    def add(self, endpoint, seconds, error=None):
+        with self.lock:
+            self.latencies[endpoint].append(seconds * 1000)
+            if error:
+                self.errors[endpoint][error] += 1
+
+
+def error_kind(status=None, exception=None):
+    """Groups failures by cause, SQLite lock errors on their own"""
+    if exception is not None:
+        message = str(exception)
+        if 'database is locked' in message or 'database table is locked' in message:
+            return 'sqlite locked'
+        return type(exception).__name__
+    if status >= 400:
+        return 'HTTP %d' % status
+    return None
+
+
+def timed(results, client, endpoint, method, path, data=None):
+    """Makes a request and records it, returns the body or None if it failed"""
+    start = time.perf_counter()
+    try:
+        status, body = client.request(method, path, data)
+    except Exception as e:
+        # Connection errors, or the app's own exceptions when it is called in process
+        results.add(endpoint, time.perf_counter() - start, error_kind(exception=e))
+        return None
+    error = error_kind(status)
+    results.add(endpoint, time.perf_counter() - start, error)
+    return None if error else body
+
+
+def build_paths():
+    """Paths of every request the students make, built up front so they need no app context"""
+    with current_app.test_request_context():
+        courses = models.Course.query.all()
+        return {
+            'courses': url_for('api.course_api'),
+            'answer': url_for('api.answer'),
+            'bundle': {course.code: url_for('api.course_questions', course=course.code) for course in courses},
+            'question': {
+                course.code: [url_for('quiz.question_course', course_code=course.code, id=number)
+                              for number in range(1, course.question_count + 1)]
+                for course in courses
+            },
+        }
+
+
+def student(client, results, deadline, rng, paths):
+    """Browses random courses until the deadline, answering the questions it is shown"""
+    body = timed(results, client, 'courses', 'GET', paths['courses'])
+    courses = [course['code'] for course in json.loads(body) if course['code'] in paths['bundle']] if body else []
+    while courses and time.monotonic() < deadline:
+        code = rng.choice(courses)
+        body = timed(results, client, 'bundle', 'GET', paths['bundle'][code])
+        questions = json.loads(body) if body else []
+        # The question pages as of when the paths were built
+        questions = questions[:len(paths['question'][code])]
+        for _ in range(min(QUESTIONS_PER_COURSE, len(questions))):
+            if time.monotonic() >= deadline:
+                break
+            number = rng.randrange(len(questions))
+            timed(results, client, 'question', 'GET', paths['question'][code][number])
+            timed(results, client, 'answer', 'POST', paths['answer'], {
+                'question': questions[number]['id'], 'correct': 'true' if rng.random() < 0.7 else 'false',
+            })
+
+
+def percentile(samples, percent):
+    """Nearest rank percentile of sorted samples"""
+    return samples[min(len(samples) - 1, max(0, -(-len(samples) * percent // 100) - 1))]
+
+
+def report(results, elapsed):
+    """Rows of endpoint, requests, requests per second, percentiles in ms and error share"""
+    rows = []
+    for endpoint in sorted(results.latencies):
+        samples = sorted(results.latencies[endpoint])
+        errors = sum(results.errors[endpoint].values())
+        rows.append([endpoint, len(samples), len(samples) / elapsed] +
+                    [percentile(samples, percent) for percent in PERCENTILES] + [errors / len(samples)])
+    return rows
+
+
+@click.command()
+@click.option('--students', '-c', default=20, show_default=True, help='Students browsing at the same time.')
+@click.option('--duration', default=30.0, show_default=True, help='Seconds to run.')
+@click.option('--url', help='Base URL of a running server, e.g. http://localhost:5000. '
+                            'Without it the app is called in process.')
+@click.option('--seed', default=0, show_default=True)
+@with_appcontext
+def load(students, duration, url, seed):
+    """Simulate concurrent students and report throughput, latency and errors"""
+    app = current_app._get_current_object()
+    # In process, exceptions reach the students and are told apart instead of all being 500s
+    app.config['PROPAGATE_EXCEPTIONS'] = True
+    results = Results()
+    rng = random.Random(seed)
+    paths = build_paths()
+    print('Running {} students against {} for {:.0f}s...'.format(students, url or 'the app', duration))
+
+    def run(student_seed):
+        # Each request pushes its own contexts, as behind a server
+        client = HTTPClient(url) if url else WSGIClient(app)
+        student(client, results, deadline, random.Random(student_seed), paths)
+
+    start = time.perf_counter()
+    deadline = time.monotonic() + duration
+    with ThreadPoolExecutor(students) as executor:
+        # Surfaces failures of the tool itself, the requests' own are counted
+        list(executor.map(run, [rng.getrandbits(32) for _ in range(students)]))
+    elapsed = time.perf_counter() - start
+
+    rows = report(results, elapsed)
+    total = sum(row[1] for row in rows)
+    print('{} requests in {:.1f}s, {:.1f} requests/s'.format(total, elapsed, total / elapsed))
+    print('{:<10}{:>10}{:>10}'.format('endpoint', 'requests', 'req/s') +
+          ''.join('{:>10}'.format('p%d ms' % percent) for percent in PERCENTILES) + '{:>10}'.format('errors'))
+    for row in rows:
+        print('{:<10}{:>10}{:>10.1f}'.format(*row[:3]) + ''.join('{:>10.1f}'.format(value) for value in row[3:-1]) +
+              '{:>10.1%}'.format(row[-1]))
+    for endpoint, errors in sorted(results.errors.items()):
+        for kind, count in errors.most_common():
+            print('{}: {} x {}'.format(endpoint, count, kind))
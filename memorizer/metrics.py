@@ -0,0 +1,177 @@
+"""Per-request query counts and timings, aggregated per endpoint on /metrics
+
+With METRICS on, every request counts its SQL queries and the time spent in
+them and in rendering templates, and /metrics serves histograms of these per
+endpoint, along with cache hits and misses, in the Prometheus text format.
+With METRICS_HEADERS on, each response also carries its own numbers in
+X-Query-Count and Server-Timing. The numbers are per process, every worker
+serves its own. Queries made while a streamed response is sent are not counted.
+/metrics is only served to METRICS_ALLOWED_IPS, or with METRICS_TOKEN as bearer token.
+"""
+import hmac
+import threading
+import time
+from collections import defaultdict
+
+from flask import (
+    Response, abort, before_render_template, current_app, g, has_request_context, request, template_rendered
+)
+from sqlalchemy import event
+
+from memorizer.cache import cache
+from memorizer.database import db
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class Histogram(object):
+    def __init__(self, name, description, buckets, label='endpoint'):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.label = label
+        # Per label value: count in each bucket, then the count and sum of all observations
+        self.values = defaultdict(lambda: [[0] * len(buckets), 0, 0])
+
+    def observe(self, label_value, value):
+        counts = self.values[label_value]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[0][i] += 1
+        counts[1] += 1
+        counts[2] += value
+
+    def lines(self):
+        yield '# HELP {} {}'.format(self.name, self.description)
+        yield '# TYPE {} histogram'.format(self.name)
+        for label_value, (buckets, count, total) in sorted(self.values.items()):
+            label = '{}="{}"'.format(self.label, label_value)
+            for bound, bucket_count in zip(self.buckets, buckets):
+                yield '{}_bucket{{{},le="{}"}} {}'.format(self.name, label, bound, bucket_count)
+            yield '{}_bucket{{{},le="+Inf"}} {}'.format(self.name, label, count)
+            yield '{}_sum{{{}}} {}'.format(self.name, label, total)
+            yield '{}_count{{{}}} {}'.format(self.name, label, count)
+
+
+class Metrics(object):
+    def __init__(self, app=None):
+        self.lock = threading.Lock()
+        self.requests = Histogram(
+            'memorizer_request_duration_seconds', 'Time spent handling requests.', DURATION_BUCKETS)
+        self.queries = Histogram('memorizer_request_queries', 'SQL queries per request.', QUERY_BUCKETS)
+        self.database = Histogram(
+            'memorizer_request_db_seconds', 'Time spent in SQL queries per request.', DURATION_BUCKETS)
+        self.render = Histogram(
+            'memorizer_request_render_seconds', 'Time spent rendering templates per request.', DURATION_BUCKETS)
+        # (kind, result): count
+        self.cache = defaultdict(int)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        headers = app.config.get('METRICS_HEADERS', False)
+        if not (app.config.get('METRICS', False) or headers):
+            return
+        app.extensions['metrics'] = {
+            'headers': headers,
+            'token': app.config.get('METRICS_TOKEN'),
+            'allowed_ips': app.config.get('METRICS_ALLOWED_IPS', ('127.0.0.1', '::1')),
+        }
+        with app.app_context():
+            for engine in db.engines.values():
+                event.listen(engine, 'before_cursor_execute', self._before_query)
+                event.listen(engine, 'after_cursor_execute', self._after_query)
+        before_render_template.connect(self._before_render, app, weak=False)
+        template_rendered.connect(self._after_render, app, weak=False)
+        # The backend made for this app by cache.init_app
+        backend = app.extensions['cache'][cache]
+        backend.get = self._counting(backend.get)
+        app.before_request(self._start)
+        app.after_request(self._add_headers)
+        # Run for failed requests too, which may not reach after_request
+        app.teardown_request(self._finish)
+        if app.config.get('METRICS', False):
+            app.add_url_rule('/metrics', 'metrics', self.view)
+
+    def _start(self):
+        g.metrics = {'start': time.perf_counter(), 'queries': 0, 'database': 0, 'render': 0, 'rendering': None}
+
+    def _before_query(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and 'metrics' in g:
+            conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+    def _after_query(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('metrics_query_start')
+        if starts and has_request_context() and 'metrics' in g:
+            g.metrics['queries'] += 1
+            g.metrics['database'] += time.perf_counter() - starts.pop()
+
+    def _before_render(self, sender, template, context, **extra):
+        if 'metrics' in g:
+            g.metrics['rendering'] = time.perf_counter()
+
+    def _after_render(self, sender, template, context, **extra):
+        if 'metrics' in g and g.metrics['rendering'] is not None:
+            g.metrics['render'] += time.perf_counter() - g.metrics['rendering']
+            g.metrics['rendering'] = None
+
+    def _counting(self, get):
+        def counting_get(key, *args, **kwargs):
+            value = get(key, *args, **kwargs)
+            kind = 'generation' if str(key).startswith('generation/') else 'memoize'
+            with self.lock:
+                self.cache[kind, 'miss' if value is None else 'hit'] += 1
+            return value
+        return counting_get
+
+    def _add_headers(self, response):
+        if 'metrics' in g and current_app.extensions['metrics']['headers']:
+            measured = g.metrics
+            duration = time.perf_counter() - measured['start']
+            response.headers['X-Query-Count'] = str(measured['queries'])
+            response.headers['Server-Timing'] = 'db;dur={:.2f}, render;dur={:.2f}, total;dur={:.2f}'.format(
+                measured['database'] * 1000, measured['render'] * 1000, duration * 1000
+            )
+        return response
+
+    def _finish(self, exception):
+        if 'metrics' not in g:
+            return
+        measured = g.pop('metrics')
+        duration = time.perf_counter() - measured['start']
+        endpoint = request.endpoint or 'none'
+        with self.lock:
+            self.requests.observe(endpoint, duration)
+            self.queries.observe(endpoint, measured['queries'])
+            self.database.observe(endpoint, measured['database'])
+            if measured['render']:
+                self.render.observe(endpoint, measured['render'])
+
+    def text(self):
+        """All metrics in the Prometheus text format"""
+        with self.lock:
+            lines = []
+            for histogram in (self.requests, self.queries, self.database, self.render):
+                lines.extend(histogram.lines())
+            lines.append('# HELP memorizer_cache_requests_total Cache lookups by kind and result.')
+            lines.append('# TYPE memorizer_cache_requests_total counter')
+            for (kind, result), count in sorted(self.cache.items()):
+                lines.append('memorizer_cache_requests_total{{kind="{}",result="{}"}} {}'.format(kind, result, count))
+        return '\n'.join(lines) + '\n'
+
+    def allowed(self):
+        """If the request may see the metrics, by its bearer token or address"""
+        settings = current_app.extensions['metrics']
+        authorization = request.headers.get('Authorization', '')
+        if settings['token'] and authorization.startswith('Bearer '):
+            return hmac.compare_digest(authorization[len('Bearer '):].encode(), settings['token'].encode())
+        return request.remote_addr in settings['allowed_ips']
+
+    def view(self):
+        if not self.allowed():
+            abort(403)
+        return Response(self.text(), mimetype='text/plain; version=0.0.4')
+
+
+metrics = Metrics()
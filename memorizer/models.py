@@ -1,12 +1,15 @@
-from flask import url_for
 from sqlalchemy import orm
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.associationproxy import association_proxy
 from sqlalchemy_utils.types.choice import ChoiceType
 from sqlalchemy_utils.types.password import PasswordType
 from werkzeug.utils import cached_property
 
+from memorizer import serializers
 from memorizer.database import db
-from memorizer.user import get_user
+
+# Dialects with INSERT ... ON CONFLICT DO NOTHING
+INSERT_IGNORING = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
 
 
 class Course(db.Model):
@@ -24,16 +27,12 @@ class Course(db.Model):
 
     @cached_property
     def question_count(self):
-        return Question.query\
-            .filter_by(course=self).join(Question.exam)\
-            .filter(Exam.hidden.is_(False)).count()
+        from memorizer.utils import all_questions
+        return len(all_questions(self.code, None))
 
     def question(self, id):
-        return Question.query\
-            .filter_by(course=self)\
-            .join(Question.exam)\
-            .filter(Exam.hidden.is_(False))\
-            .offset(id - 1).limit(1)
+        from memorizer.utils import all_questions
+        return Question.at_position(all_questions(self.code, None), id)
 
     def stats(self):
         from memorizer.utils import generate_stats
@@ -42,13 +41,12 @@ class Course(db.Model):
     def __repr__(self):
         return self.code + ' ' + self.name
 
-    def serialize(self):
-        return {
-            'id': self.id,
-            'code': self.code,
-            'name': self.name,
-            'str': str(self)
-        }
+    def cache_scope(self):
+        """Course code and exam names whose cached data depends on this object"""
+        return self.code, [exam.name for exam in self.exams]
+
+    def serialize(self, context=None):
+        return serializers.course(self)
 
     @property
     def string(self):
@@ -60,7 +58,7 @@ class Exam(db.Model):
     __tablename__ = 'exam'
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, info={'label': 'Navn'})
-    course_id = db.Column(db.Integer, db.ForeignKey('course.id'))
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), index=True)
     questions = db.relationship('Question', backref='exam')
     multiple_correct = db.Column(db.Boolean, server_default=db.literal(False), nullable=False, default=False, info={
                                  'label': 'Flere korrekte svar per spørsmål'})
@@ -74,12 +72,14 @@ class Exam(db.Model):
 
     @cached_property
     def question_count(self):
-        return Question.query.filter_by(exam=self).count()
+        from memorizer.utils import all_questions
+        return len(all_questions(self.course.code, self.name))
 
     def question(self, id):
+        from memorizer.utils import all_questions
         if self.hidden:
             return None
-        return Question.query.filter_by(exam=self).offset(id - 1).limit(1)
+        return Question.at_position(all_questions(self.course.code, self.name), id)
 
     def stats(self):
         from memorizer.utils import generate_stats
@@ -88,18 +88,13 @@ class Exam(db.Model):
     def __repr__(self):
         return self.name
 
-    def serialize(self):
-        # Hack to hide hidden exams
-        if self.hidden:
-            user = get_user()
-            if not user.admin:
-                return None
-        return {
-            'id': self.id,
-            'name': self.name,
-            'course_id': self.course_id,
-            'multiple_correct': self.multiple_correct,
-        }
+    def cache_scope(self):
+        if self.course:
+            return self.course.code, [self.name]
+
+    def serialize(self, context=None):
+        # None for hidden exams, unless serializing for an admin
+        return serializers.exam(self, context or serializers.request_context())
 
     @property
     def string(self):
@@ -118,7 +113,7 @@ class Question(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     text = db.Column(db.String, info={'label': 'Oppgavetekst'})
     image = db.Column(db.String, info={'label': 'Bilde'})
-    exam_id = db.Column(db.Integer, db.ForeignKey('exam.id'))
+    exam_id = db.Column(db.Integer, db.ForeignKey('exam.id'), index=True)
     course = association_proxy('exam', 'course')
     reason = db.Column(db.String, info={'label': 'Forklaring'})
 
@@ -138,6 +133,18 @@ class Question(db.Model):
     def __repr__(self):
         return self.text
 
+    def cache_scope(self):
+        if self.exam:
+            return self.exam.cache_scope()
+
+    @classmethod
+    def serializable(cls):
+        """Query loading everything serialize() needs up front instead of per question"""
+        return cls.query.options(
+            orm.joinedload(cls.exam).joinedload(Exam.course),
+            orm.selectinload(cls.alternatives)
+        ).order_by(cls.id)
+
     @property
     def multiple(self):
         return self.type == self.MULTIPLE
@@ -147,42 +154,30 @@ class Question(db.Model):
         if self.multiple:
             return self.alternatives
 
+    @classmethod
+    def at_position(cls, ids, position):
+        """Query for the question at a position (starting at 1) in an ordered list of ids"""
+        if 1 <= position <= len(ids):
+            return cls.query.filter_by(id=ids[position - 1])
+        return cls.query.filter(db.false())
+
     @property
     def index(self):
         return Question.find_index(self)
 
+    @property
+    def course_index(self):
+        """Position within the course, None for questions in hidden exams"""
+        from memorizer.utils import question_positions
+        return question_positions(self.course.code, None).get(self.id)
+
     @classmethod
     def find_index(cls, question):
-        indexes = [q.id for q in cls.query.filter_by(exam_id=question.exam_id).all()]
-        return indexes.index(question.id) + 1
-
-    def serialize(self):
-        if self.exam.hidden:
-            user = get_user()
-            if not user.admin:
-                return None
-        response = {
-            'id': self.id,
-            'text': self.text,
-            'exam_id': self.exam_id,
-            'multiple': self.multiple,
-            'type': self.type.code
-        }
-        if self.multiple:
-            response['alternatives'] = []
-            for alt in self.alternatives:
-                alt_dict = alt.serialize()
-                del alt_dict['question_id']
-                response['alternatives'].append(alt_dict)
-        else:
-            response['correct'] = self.correct
-        if self.image:
-            if self.image.startswith('http://'):
-                response['image'] = self.image
-            else:
-                # this is not efficient
-                response['image'] = url_for('static', filename='img/' + self.course.code + '/' + self.image)
-        return response
+        from memorizer.utils import question_positions
+        return question_positions(question.course.code, question.exam.name).get(question.id)
+
+    def serialize(self, context=None):
+        return serializers.question(self, context or serializers.request_context())
 
 
 class Alternative(db.Model):
@@ -191,7 +186,7 @@ class Alternative(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     text = db.Column(db.String, info={'label': 'Tekst'})
     correct = db.Column(db.Boolean, info={'label': 'Korrekt'})
-    question_id = db.Column(db.Integer, db.ForeignKey('question.id'))
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), index=True)
 
     def __init__(self, text=None, correct=None, question_id=None):
         self.text = text
@@ -201,13 +196,12 @@ class Alternative(db.Model):
     def __repr__(self):
         return self.text
 
-    def serialize(self):
-        return {
-            'id': self.id,
-            'text': self.text,
-            'correct': self.correct,
-            'question_id': self.question_id
-        }
+    def cache_scope(self):
+        if self.question:
+            return self.question.cache_scope()
+
+    def serialize(self, context=None):
+        return serializers.alternative(self)
 
 
 class User(db.Model):
@@ -229,8 +223,14 @@ class User(db.Model):
 
 class Stats(db.Model):
     __tablename__ = 'stats'
+    __table_args__ = (
+        db.Index('ix_stats_user_id_reset_question_id', 'user_id', 'reset', 'question_id'),
+        # Only the first answer counts, until the stats are reset
+        db.Index('uq_stats_user_id_question_id_active', 'user_id', 'question_id', unique=True,
+                 sqlite_where=db.text('NOT reset'), postgresql_where=db.text('NOT reset')),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    question_id = db.Column(db.Integer, db.ForeignKey('question.id'))
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), index=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     correct = db.Column(db.Boolean)
     reset = db.Column(db.Boolean)
@@ -246,8 +246,7 @@ class Stats(db.Model):
 
     @classmethod
     def course(cls, user, course_code):
-        course_m = Course.query.filter_by(code=course_code).one_or_none()
-        questions = Question.query.filter_by(course=course_m)
+        questions = Question.query.join(Exam).join(Course).filter(Course.code == course_code)
         return cls.query.filter(
             Stats.reset.is_(False),
             Stats.user_id == user.id,
@@ -256,9 +255,8 @@ class Stats(db.Model):
 
     @classmethod
     def exam(cls, user, course_code, exam_name):
-        course_m = Course.query.filter_by(code=course_code).one_or_none()
-        exam_m = Exam.query.filter_by(course=course_m, name=exam_name).one_or_none()
-        questions = Question.query.filter_by(exam=exam_m)
+        questions = Question.query.join(Exam).join(Course)\
+            .filter(Course.code == course_code, Exam.name == exam_name)
         return cls.query.filter(
             Stats.reset.is_(False),
             Stats.user_id == user.id,
@@ -267,7 +265,34 @@ class Stats(db.Model):
 
     @classmethod
     def answered(cls, user, question):
-        return cls.query.filter_by(user=user, question=question, reset=False).count() > 0
+        return cls.query.filter_by(user_id=user.id, question_id=question.id, reset=False).count() > 0
+
+    @classmethod
+    def record(cls, user, question, correct):
+        """Saves an answer unless the question is already answered, returns whether it was saved"""
+        dialect = db.session.get_bind().dialect.name
+        if dialect not in INSERT_IGNORING:
+            if cls.answered(user, question):
+                return False
+            db.session.add(cls(user, question, correct))
+            return True
+        # A single statement, so concurrent double submits can't both count
+        statement = INSERT_IGNORING[dialect](cls).values(
+            user_id=user.id, question_id=question.id, correct=correct, reset=False
+        ).on_conflict_do_nothing()
+        return db.session.execute(statement).rowcount == 1
+
+    @classmethod
+    def record_many(cls, answers):
+        """Saves answers given as dicts of user_id, question_id and correct, like record"""
+        rows = [dict(answer, reset=False) for answer in answers]
+        dialect = db.session.get_bind().dialect.name
+        if dialect not in INSERT_IGNORING:
+            for row in rows:
+                if not cls.query.filter_by(user_id=row['user_id'], question_id=row['question_id'], reset=False).count():
+                    db.session.execute(cls.__table__.insert().values(**row))
+            return
+        db.session.execute(INSERT_IGNORING[dialect](cls).on_conflict_do_nothing(), rows)
 
 
 orm.configure_mappers()
@@ -0,0 +1,81 @@
+"""Turning models into the dicts sent by the API
+
+What depends on the request, the user and the url of the static files, is
+looked up once in a Context instead of for every object.
+"""
+from operator import attrgetter
+from urllib.parse import quote
+
+from flask import g, url_for
+
+from memorizer.user import get_user
+
+COURSE_FIELDS = ('id', 'code', 'name')
+EXAM_FIELDS = ('id', 'name', 'course_id', 'multiple_correct')
+QUESTION_FIELDS = ('id', 'text', 'exam_id', 'multiple')
+ALTERNATIVE_FIELDS = ('id', 'text', 'correct', 'question_id')
+# Alternatives nested in questions leave out the question
+NESTED_ALTERNATIVE_FIELDS = ('id', 'text', 'correct')
+
+_course_values = attrgetter(*COURSE_FIELDS)
+_exam_values = attrgetter(*EXAM_FIELDS)
+_question_values = attrgetter(*QUESTION_FIELDS)
+_alternative_values = attrgetter(*ALTERNATIVE_FIELDS)
+_nested_alternative_values = attrgetter(*NESTED_ALTERNATIVE_FIELDS)
+
+
+class Context(object):
+    def __init__(self, user=None):
+        self.user = user
+        # Hidden exams are only shown to admins
+        self.admin = bool(user and user.admin)
+        self.image_prefix = url_for('static', filename='img/')
+
+    def image_url(self, course_code, image):
+        if image.startswith('http://'):
+            return image
+        # Quoted the way url_for quotes paths
+        return self.image_prefix + quote(course_code + '/' + image, safe="!$&'()*+,/:;=@")
+
+
+def request_context():
+    """Context of the current user, made once per request"""
+    user = get_user()
+    context = g.get('serializer_context')
+    if context is None or context.user is not user:
+        context = g.serializer_context = Context(user)
+    return context
+
+
+def course(course_m):
+    response = dict(zip(COURSE_FIELDS, _course_values(course_m)))
+    response['str'] = str(course_m)
+    return response
+
+
+def exam(exam_m, context):
+    if exam_m.hidden and not context.admin:
+        return None
+    return dict(zip(EXAM_FIELDS, _exam_values(exam_m)))
+
+
+def alternative(alternative_m):
+    return dict(zip(ALTERNATIVE_FIELDS, _alternative_values(alternative_m)))
+
+
+def question(question_m, context):
+    exam_m = question_m.exam
+    if exam_m.hidden and not context.admin:
+        return None
+    response = dict(zip(QUESTION_FIELDS, _question_values(question_m)))
+    response['type'] = question_m.type.code
+    if question_m.multiple:
+        response['alternatives'] = [
+            dict(zip(NESTED_ALTERNATIVE_FIELDS, _nested_alternative_values(alt)))
+            for alt in question_m.alternatives
+        ]
+    else:
+        response['correct'] = question_m.correct
+    if question_m.image:
+        response['image'] = context.image_url(exam_m.course.code, question_m.image)
+    return response
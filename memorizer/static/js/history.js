@@ -0,0 +1,86 @@
+// Version history in admin pages. Only the newest versions are rendered by the server,
+// older ones and the changes made in each version are fetched when asked for.
+
+var VersionHistory = (function() {
+    var escape = function(text) {
+        var element = document.createElement('div');
+        element.textContent = text;
+        return element.innerHTML;
+    };
+
+    var failed = function() {
+        Alert('Не удалось получить данные. Попробуйте перезагрузить страницу.', 'error');
+    };
+
+    var toggleChanges = function(e) {
+        e.preventDefault();
+        var link = e.currentTarget;
+        var container = link.nextElementSibling;
+        if(container.dataset.loaded) {
+            container.classList.toggle('collapsed');
+            return;
+        }
+        var url = link.parentNode.parentNode.dataset.url + link.dataset.transaction + '/';
+        Ajax({url: url}, {
+            success: function(data) {
+                if(!data.changes) {
+                    return failed();
+                }
+                var rows = '';
+                for(var i = 0; i < data.changes.length; i++) {
+                    rows += '<tr><td>' + data.changes[i].map(escape).join('</td><td>') + '</td></tr>';
+                }
+                container.innerHTML = '<table><thead><tr><th>ввод</th><th>вперед</th><th>назад</th></tr></thead>' +
+                    '<tbody>' + rows + '</tbody></table>';
+                container.dataset.loaded = true;
+                container.classList.remove('collapsed');
+            },
+            error: failed
+        });
+    };
+
+    var addVersion = function(list, more, version) {
+        var item = document.createElement('li');
+        var label = version.issued_at + ' #' + version.number + (version.user ? ' av ' + version.user : '');
+        item.innerHTML = '<a href="#" class="history-version" data-transaction="' + version.transaction_id + '">' +
+            escape(label) + '</a><div class="collapsed"></div>';
+        item.firstChild.addEventListener('click', toggleChanges, false);
+        list.insertBefore(item, more);
+    };
+
+    var loadMore = function(e) {
+        e.preventDefault();
+        var more = e.currentTarget.parentNode;
+        var list = more.parentNode;
+        Ajax({url: list.dataset.url, data: {before: list.dataset.before}}, {
+            success: function(data) {
+                if(!data.versions) {
+                    return failed();
+                }
+                for(var i = 0; i < data.versions.length; i++) {
+                    addVersion(list, more, data.versions[i]);
+                }
+                list.dataset.before = data.before || '';
+                if(!data.before) {
+                    list.removeChild(more);
+                }
+            },
+            error: failed
+        });
+    };
+
+    return {
+        init: function() {
+            var versions = document.querySelectorAll('.history .history-version');
+            for(var i = 0; i < versions.length; i++) {
+                versions[i].addEventListener('click', toggleChanges, false);
+            }
+            var more = document.querySelectorAll('.history .history-more a');
+            for(var j = 0; j < more.length; j++) {
+                more[j].addEventListener('click', loadMore, false);
+            }
+        }
+    };
+})();
+
+VersionHistory.init();
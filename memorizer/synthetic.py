@@ -0,0 +1,244 @@
+"""Synthetic courses, questions, users and answers for measuring how the app scales"""
+import random
+import statistics
+import time
+
+import click
+from flask import current_app, url_for
+from flask.cli import with_appcontext
+
+from memorizer import models
+from memorizer.cache import cache
+from memorizer.database import db
+from memorizer.importer import unversioned_import
+from memorizer.load import outside_context
+
+BATCH_SIZE = 50000
+# Share of the answers that have been reset, the rest are active
+RESET_SHARE = 0.1
+# Courses every synthetic student answers questions in
+COURSES_PER_USER = 3
+
+
+def _insert(model, rows, ids=False):
+    """Inserts rows in batches, returns the new ids in order when ids is set"""
+    table = model.__table__
+    statement = table.insert().returning(table.c.id, sort_by_parameter_order=True) if ids else table.insert()
+    new_ids = []
+    for start in range(0, len(rows), BATCH_SIZE):
+        result = db.session.execute(statement, rows[start:start + BATCH_SIZE])
+        if ids:
+            new_ids.extend(result.scalars().all())
+    return new_ids
+
+
+def _spread(total, parts):
+    """Splits total into parts that differ by at most one"""
+    return [total // parts + (1 if i < total % parts else 0) for i in range(parts)]
+
+
+def add_students(question_ids, count, answers, rng, reset_share=RESET_SHARE):
+    """Adds users who answered questions in a few courses each, returns their ids and the number of answers
+
+    question_ids holds the question ids of every course. The answers are spread over the users,
+    each answers a question at most once, so there may be fewer if the courses are small.
+    """
+    user_ids = _insert(models.User, [{'registered': False, 'admin': False} for _ in range(count)], ids=True)
+    courses = [course for course, ids in question_ids.items() if ids]
+    rows = []
+    stats = 0
+    for user_id, size in zip(user_ids, _spread(answers, max(1, count))):
+        candidates = [
+            question_id
+            for course in rng.sample(courses, min(COURSES_PER_USER, len(courses)))
+            for question_id in question_ids[course]
+        ]
+        # Distinct questions, only one answer per question may be active
+        for question_id in rng.sample(candidates, min(size, len(candidates))):
+            rows.append({
+                'user_id': user_id, 'question_id': question_id,
+                'correct': rng.random() < 0.7, 'reset': rng.random() < reset_share,
+            })
+        if len(rows) >= BATCH_SIZE:
+            stats += len(rows)
+            _insert(models.Stats, rows)
+            rows = []
+    _insert(models.Stats, rows)
+    return user_ids, stats + len(rows)
+
+
+class Generator:
+    """Adds synthetic rows to the database, a step at a time
+
+    Courses are created on the first step, later steps add exams to them, so the number of
+    questions per course grows with the data like in a long running installation.
+    """
+
+    def __init__(self, courses=10, questions_per_exam=50, alternatives=4, rng=None):
+        self.courses = courses
+        self.questions_per_exam = questions_per_exam
+        self.alternatives = alternatives
+        self.rng = rng or random.Random(0)
+        self.course_codes = []
+        # Question ids of every synthetic course, answers are drawn from these
+        self.question_ids = {}
+        self.exams = 0
+
+    def add_courses(self):
+        first = models.Course.query.count() + 1
+        codes = ['SYN%05d' % number for number in range(first, first + self.courses)]
+        ids = _insert(models.Course, [{'code': code, 'name': 'Synthetic course ' + code} for code in codes], ids=True)
+        self.course_codes = codes
+        self.question_ids = {course_id: [] for course_id in ids}
+
+    def add_questions(self, count):
+        """Adds exams of questions_per_exam questions to the courses in turn"""
+        course_ids = list(self.question_ids)
+        exams = [course_ids[(self.exams + i) % len(course_ids)]
+                 for i in range(max(1, count // self.questions_per_exam))]
+        exam_ids = _insert(models.Exam, [
+            {'name': 'Exam %d' % (self.exams + i + 1), 'course_id': course_id,
+             'multiple_correct': False, 'hidden': False}
+            for i, course_id in enumerate(exams)
+        ], ids=True)
+        self.exams += len(exams)
+        rows, courses = [], []
+        for exam_id, course_id, size in zip(exam_ids, exams, _spread(count, len(exam_ids))):
+            for _ in range(size):
+                # Every fifth question is a true or false question
+                boolean = self.rng.random() < 0.2
+                rows.append({
+                    'text': 'Synthetic question %d' % self.rng.getrandbits(32), 'image': '', 'exam_id': exam_id,
+                    'reason': None, 'type': models.Question.BOOLEAN if boolean else models.Question.MULTIPLE,
+                    'correct': self.rng.random() < 0.5 if boolean else None,
+                })
+                courses.append(course_id)
+        question_ids = _insert(models.Question, rows, ids=True)
+        alternatives = []
+        for row, question_id, course_id in zip(rows, question_ids, courses):
+            self.question_ids[course_id].append(question_id)
+            if row['type'] == models.Question.MULTIPLE:
+                correct = self.rng.randrange(self.alternatives)
+                alternatives.extend(
+                    {'text': 'Alternative %d' % number, 'correct': number == correct, 'question_id': question_id}
+                    for number in range(self.alternatives)
+                )
+        _insert(models.Alternative, alternatives)
+        return len(rows) + len(alternatives)
+
+    def add_users(self, count, answers):
+        """Adds users who answered questions in a few courses each, returns their ids and the number of answers"""
+        return add_students(self.question_ids, count, answers, self.rng)
+
+
+def endpoints(generator, rng):
+    """Requests made at every size, as name and a function making one request with a test client"""
+    def course():
+        return rng.choice(generator.course_codes)
+
+    def question():
+        code = course()
+        number = rng.randint(1, models.Course.query.filter_by(code=code).one().question_count)
+        return 'GET', url_for('quiz.question_course', course_code=code, id=number), None
+
+    def answer():
+        return 'POST', url_for('quiz.question_course', course_code=course(), id=1), {'answer': 'true'}
+
+    def random_question():
+        return 'GET', url_for('quiz.course', course=course()), None
+
+    def bundle():
+        return 'GET', url_for('api.course_questions', course=course()), None
+
+    def api_answer():
+        course_id = rng.choice([course_id for course_id, ids in generator.question_ids.items() if ids])
+        question_id = rng.choice(generator.question_ids[course_id])
+        return 'POST', url_for('api.answer'), {'question': question_id, 'correct': 'true'}
+
+    return [
+        ('quiz question', question),
+        ('quiz answer', answer),
+        ('random question', random_question),
+        ('course bundle', bundle),
+        ('api answer', api_answer),
+    ]
+
+
+def measure(requests, user_ids, iterations, rng):
+    """Median milliseconds of every request, with the caches cleared before each one"""
+    client = current_app.test_client()
+    medians = {}
+    for name, request in requests:
+        # Built up front, in the command's contexts, which the requests themselves must not share
+        built = [request() for _ in range(iterations)]
+        samples = []
+        for method, url, data in built:
+            with client.session_transaction() as session:
+                session['user'] = rng.choice(user_ids)
+            # Misses are what grows with the data, hits cost the same at any size
+            cache.clear()
+            start = time.perf_counter()
+            response = outside_context(client.open, url, method=method, data=data)
+            samples.append((time.perf_counter() - start) * 1000)
+            if response.status_code >= 400:
+                raise click.ClickException('{} {} failed with {}'.format(method, url, response.status_code))
+        medians[name] = statistics.median(samples)
+    return medians
+
+
+@click.command()
+@click.option('--courses', default=10, show_default=True)
+@click.option('--questions', default=100000, show_default=True, help='Questions at the largest size.')
+@click.option('--questions-per-exam', default=50, show_default=True)
+@click.option('--alternatives', default=4, show_default=True, help='Alternatives of multiple choice questions.')
+@click.option('--users', default=100000, show_default=True, help='Users at the largest size.')
+@click.option('--stats', default=10000000, show_default=True, help='Answers at the largest size.')
+@click.option('--steps', default=4, show_default=True, help='Sizes measured, each twice the previous one.')
+@click.option('--iterations', default=20, show_default=True, help='Requests per endpoint and size.')
+@click.option('--seed', default=0, show_default=True)
+@click.option('--yes', is_flag=True, help='Add the data without asking, even if the database has courses.')
+@with_appcontext
+def generate_synthetic(courses, questions, questions_per_exam, alternatives, users, stats, steps, iterations, seed,
+                       yes):
+    """Fill the database with synthetic data and print how latency grows with it"""
+    if not yes and models.Course.query.first() is not None:
+        click.confirm('{} already has courses, add synthetic data to it?'.format(db.engine.url), abort=True)
+    rng = random.Random(seed)
+    generator = Generator(courses, questions_per_exam, alternatives, rng)
+    # Sizes double up to the requested one
+    fractions = [2 ** (step - steps + 1) for step in range(steps)]
+    done = {'questions': 0, 'users': 0, 'stats': 0}
+    user_ids = []
+    requests = endpoints(generator, rng)
+    curve = []
+    for fraction in fractions:
+        start = time.perf_counter()
+        target = {'questions': int(questions * fraction), 'users': max(1, int(users * fraction)),
+                  'stats': int(stats * fraction)}
+        with unversioned_import('Generated synthetic data'):
+            if not generator.course_codes:
+                generator.add_courses()
+            generator.add_questions(target['questions'] - done['questions'])
+            new_users, answers = generator.add_users(target['users'] - done['users'], target['stats'] - done['stats'])
+            db.session.commit()
+        user_ids.extend(new_users)
+        done = dict(target, stats=done['stats'] + answers)
+        print('Generated {questions} questions, {users} users and {stats} answers in {seconds:.1f}s'.format(
+            seconds=time.perf_counter() - start, **done
+        ))
+        with current_app.test_request_context():
+            curve.append((done, measure(requests, user_ids, iterations, rng)))
+
+    names = [name for name, request in requests]
+    print()
+    print('Median ms per request with empty caches')
+    print('{:>10}{:>10}{:>12}'.format('questions', 'users', 'answers') + ''.join('{:>17}'.format(n) for n in names))
+    for size, medians in curve:
+        print('{questions:>10}{users:>10}{stats:>12}'.format(**size) +
+              ''.join('{:>17.2f}'.format(medians[name]) for name in names))
+    if len(curve) > 1:
+        (first, first_medians), (last, last_medians) = curve[0], curve[-1]
+        growth = last['stats'] / first['stats'] if first['stats'] else float('nan')
+        print('Growth from the smallest to the largest size, answers grew {:.0f}x:'.format(growth))
+        for name in names:
+            print('  {:<17}{:.1f}x'.format(name, last_medians[name] / first_medians[name]))
@@ -1,6 +1,6 @@
 from functools import wraps
 
-from flask import g, redirect, request, session, url_for
+from flask import g, has_request_context, redirect, request, session, url_for
 
 
 def user_setup():
@@ -12,18 +12,25 @@ def user_setup():
         user = models.User.query.get(session['user'])
         if user:
             return user
-    user = models.User()
-    models.db.session.add(user)
-    models.db.session.commit()
-    session['user'] = user.id
-    # Set session to permament
-    session.permanent = True
-    return user
+    # Not saved until there is something to save, see persist_user
+    return models.User()
+
+
+def persist_user(user):
+    """Saves a first time visitor, as part of the transaction saving what they did"""
+    from memorizer import models
+
+    if user.id is None:
+        models.db.session.add(user)
+        models.db.session.flush()
+        session['user'] = user.id
+        # Set session to permament
+        session.permanent = True
 
 
 def get_user():
     user = getattr(g, 'user', None)
-    if not user and not request.remote_addr:
+    if not user and not (has_request_context() and request.remote_addr):
         # TODO: None is returned here for SQLAlchemy-Continuum
         # when running cli commands
         return None
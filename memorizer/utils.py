@@ -1,13 +1,19 @@
 import random
 import re
 
+from sqlalchemy import case, func
+
 from memorizer import models
-from memorizer.cache import cache
+from memorizer.answer_buffer import answer_buffer
+from memorizer.cache import cache, course_generation, generation, invalidate, memoize_course
 from memorizer.config import CACHE_TIME
-from memorizer.user import get_user
+from memorizer.user import get_user, persist_user
+
+# Longest a request may hold the lock on the answered sets of a user
+ANSWERED_LOCK_TIMEOUT = 10
 
 
-@cache.memoize(CACHE_TIME)
+@memoize_course(CACHE_TIME)
 def max_questions_exam(course_code, exam_name):
     return models.Question.query.\
         join(models.Exam).join(models.Course).\
@@ -15,7 +21,7 @@ def max_questions_exam(course_code, exam_name):
         filter(models.Exam.name == exam_name).count()
 
 
-@cache.memoize(CACHE_TIME)
+@memoize_course(CACHE_TIME)
 def max_questions_course(course_code):
     course = models.Course.query.filter_by(code=course_code).first()
     if course:
@@ -26,29 +32,36 @@ def max_questions_course(course_code):
 
 def generate_stats(course_code, exam_name=None):
     stats_data = {}
+    user = get_user()
     if not exam_name:
         stats_data['max'] = max_questions_course(course_code)
-        stats = models.Stats.course(get_user(), course_code)
+        stats = models.Stats.course(user, course_code)
     else:
         stats_data['max'] = max_questions_exam(course_code, exam_name)
-        stats = models.Stats.exam(get_user(), course_code, exam_name)
-    stats_all = stats.all()
-    stats_data['total'] = len(stats_all)
-    stats_data['points'] = len(list(filter(lambda stat: stat.correct, stats_all)))
+        stats = models.Stats.exam(user, course_code, exam_name)
+    # Combo is the number of correct answers since the last miss
+    last_miss = stats.filter(models.Stats.correct.isnot(True))\
+        .with_entities(func.max(models.Stats.id)).correlate(None).scalar_subquery()
+    total, points, combo = stats.with_entities(
+        func.count(models.Stats.id),
+        func.sum(case((models.Stats.correct.is_(True), 1), else_=0)),
+        func.sum(case((models.Stats.id > func.coalesce(last_miss, 0), 1), else_=0))
+    ).one()
+    points, combo = points or 0, combo or 0
+    # Answers not yet written by the answer buffer come after the saved ones
+    for correct in answer_buffer.answers(user.id, course_code, exam_name):
+        total += 1
+        points += correct
+        combo = combo + 1 if correct else 0
+    stats_data['total'] = total
+    stats_data['points'] = points
     stats_data['grade'] = grade(stats_data['points'], stats_data['total'])
     stats_data['percentage'] = percentage(stats_data['points'], stats_data['total'])
-
-    combo = 0
-    for stat in reversed(stats_all):
-        if stat.correct:
-            combo += 1
-        else:
-            break
     stats_data['combo'] = combo
     return stats_data
 
 
-@cache.memoize(CACHE_TIME)
+@memoize_course(CACHE_TIME)
 def all_questions(course_code, exam_name):
     course_m = models.Course.query.filter_by(code=course_code).one_or_none()
     if exam_name:
@@ -59,7 +72,137 @@ def all_questions(course_code, exam_name):
             .filter_by(course=course_m)\
             .join(models.Exam)\
             .filter(models.Exam.hidden.is_(False))
-    return questions.with_entities(models.Question.id).order_by('id').all()
+    return [question_id for question_id, in questions.with_entities(models.Question.id).order_by('id')]
+
+
+@memoize_course(CACHE_TIME)
+def question_positions(course_code, exam_name):
+    """Maps question ids to their position (starting at 1) in all_questions"""
+    return {question_id: i + 1 for i, question_id in enumerate(all_questions(course_code, exam_name))}
+
+
+class AnsweredSet:
+    """Bitset of the question positions a user has answered in a course or exam"""
+    # Random picks to try before falling back to listing the unanswered positions
+    SAMPLE_TRIES = 8
+
+    def __init__(self, size):
+        self.size = size
+        self.count = 0
+        self.bits = bytearray((size + 7) // 8)
+
+    def __contains__(self, position):
+        byte, bit = divmod(position - 1, 8)
+        return bool(self.bits[byte] & (1 << bit))
+
+    def __len__(self):
+        return self.count
+
+    def add(self, position):
+        byte, bit = divmod(position - 1, 8)
+        if not self.bits[byte] & (1 << bit):
+            self.bits[byte] |= 1 << bit
+            self.count += 1
+
+    def random_unanswered(self, exclude=None):
+        """Returns a random unanswered position other than exclude, or None"""
+        if not isinstance(exclude, int) or not 1 <= exclude <= self.size:
+            exclude = None
+        unanswered = self.size - self.count
+        if exclude is not None and exclude not in self:
+            unanswered -= 1
+        if unanswered <= 0:
+            return None
+        # Constant time on average as long as a fair share is unanswered
+        for _ in range(self.SAMPLE_TRIES):
+            position = random.randint(1, self.size)
+            if position != exclude and position not in self:
+                return position
+        # Almost everything is answered, skip the full bytes
+        positions = [
+            byte * 8 + bit + 1
+            for byte, value in enumerate(self.bits) if value != 0xff
+            for bit in range(8) if not value & (1 << bit)
+        ]
+        return random.choice([p for p in positions if p <= self.size and p != exclude])
+
+
+def _answered_key(user, course_code, exam_name):
+    # Positions change when questions do, so the set follows the course generation,
+    # and the user's own generation drops every set of the user at once
+    return 'answered/{}/{}/{}/{}/{}'.format(
+        user.id, course_code, exam_name or '', course_generation(course_code, exam_name),
+        generation('answered', user.id)
+    )
+
+
+def answered_set(user, course_code, exam_name=None):
+    """Cached AnsweredSet for a user, built from Stats on first use"""
+    if user.id is None:
+        # Visitors who haven't answered anything yet aren't saved
+        return AnsweredSet(len(question_positions(course_code, exam_name)))
+    key = _answered_key(user, course_code, exam_name)
+    answered = cache.get(key)
+    if answered is None:
+        positions = question_positions(course_code, exam_name)
+        if exam_name:
+            query = models.Stats.exam(user, course_code, exam_name)
+        else:
+            query = models.Stats.course(user, course_code)
+        answered = AnsweredSet(len(positions))
+        for question_id, in query.with_entities(models.Stats.question_id):
+            if question_id in positions:
+                answered.add(positions[question_id])
+        cache.set(key, answered, CACHE_TIME)
+    return answered
+
+
+def record_answer(user, question, correct):
+    """Saves the answer of a user unless already answered, returns whether it counted"""
+    if answer_buffer.enabled and user.id is not None:
+        first = answer_buffer.add(user, question, correct)
+    else:
+        persist_user(user)
+        first = models.Stats.record(user, question, correct)
+        models.db.session.commit()
+    if first:
+        mark_answered(user, question)
+    return first
+
+
+def mark_answered(user, question):
+    """Adds a newly answered question to the cached sets of its course and exam
+
+    Sets are read, changed and written back, so only one request may update them at a
+    time. When another one is at it, the sets are dropped and built again from Stats,
+    which has both answers by then.
+    """
+    lock = 'answered-lock/{}'.format(user.id)
+    if not cache.add(lock, True, timeout=ANSWERED_LOCK_TIMEOUT):
+        invalidate('answered', user.id)
+        return
+    try:
+        course_code = question.course.code
+        for exam_name in (None, question.exam.name):
+            key = _answered_key(user, course_code, exam_name)
+            answered = cache.get(key)
+            if answered is None:
+                # Will be built from Stats when needed
+                continue
+            positions = question_positions(course_code, exam_name)
+            if question.id in positions:
+                answered.add(positions[question.id])
+                cache.set(key, answered, CACHE_TIME)
+    finally:
+        cache.delete(lock)
+
+
+def clear_answered(user, course, exam=None):
+    """Drops the cached sets after stats for a course or exam are reset"""
+    exams = [exam] if exam else course.exams
+    keys = [_answered_key(user, course.code, None)]
+    keys += [_answered_key(user, course.code, exam_m.name) for exam_m in exams]
+    cache.delete_many(*keys)
 
 
 def random_id(id=None, course=None, exam=None):
@@ -69,18 +212,10 @@ def random_id(id=None, course=None, exam=None):
     """
     # All questions
     questions = all_questions(course, exam)
-    # Already answered questions
-    if exam:
-        query = models.Stats.exam(get_user(), course, exam)
-    else:
-        query = models.Stats.course(get_user(), course)
-    answered = set(query.with_entities(models.Stats.question_id).all())
-    # List of indexes for unanswered questions
-    indexes = [i + 1 for i, question in enumerate(questions) if (i + 1) != id and question not in answered]
     # Ignore current question
-    if indexes:
-        # Select random index
-        return random.choice(indexes)
+    index = answered_set(get_user(), course, exam).random_unanswered(exclude=id)
+    if index:
+        return index
     else:
         # All questions have been answered
         return random.randint(1, len(questions) + 1)
@@ -2,7 +2,7 @@ import json
 
 from flask import Blueprint, flash, render_template, request
 
-from memorizer import importer, models
+from memorizer import history, importer, models
 from memorizer.forms import AlternativeForm, CourseForm, ExamForm, QuestionForm
 from memorizer.user import login_required
 
@@ -46,7 +46,7 @@ def course(course_id):
     form = CourseForm(obj=course)
     exam = models.Exam(course_id=course.id)
     exam_form = ExamForm(obj=exam)
-    context = dict(course=course, form=form, exam_form=exam_form)
+    context = dict(course=course, form=form, exam_form=exam_form, history=history.versions(course))
     return render_template('admin/course.html', **context)
 
 
@@ -58,7 +58,9 @@ def exam(course_id, exam_id):
     form = ExamForm(obj=exam)
     question = models.Question(exam_id=exam.id)
     question_form = QuestionForm(obj=question)
-    context = dict(exam=exam, course=course, form=form, question_form=question_form)
+    context = dict(
+        exam=exam, course=course, form=form, question_form=question_form, history=history.versions(exam)
+    )
     return render_template('admin/exam.html', **context)
 
 
@@ -67,14 +69,14 @@ def exam(course_id, exam_id):
 def question(question_id):
     question = question = models.Question.query.filter_by(id=question_id).first_or_404()
     query = models.Question.query.filter_by(exam=question.exam)
-    prev_question = query.filter(models.Question.id < question_id).order_by('-id').first()
+    prev_question = query.filter(models.Question.id < question_id).order_by(models.Question.id.desc()).first()
     next_question = query.filter(models.Question.id > question_id).first()
     form = QuestionForm(obj=question)
     alt = models.Alternative(question_id=question.id)
     alt_form = AlternativeForm(obj=alt)
     context = dict(
         question=question, form=form, alt_form=alt_form,
-        next_question=next_question, prev_question=prev_question
+        next_question=next_question, prev_question=prev_question, history=history.versions(question)
     )
     return render_template('admin/question.html', **context)
 
@@ -1,67 +1,183 @@
+import hashlib
 import json
+from time import time
 
-from flask import Blueprint, Response, request
+from flask import Blueprint, Response, abort, request, stream_with_context, url_for
 from flask.views import MethodView
+from werkzeug.http import is_resource_modified
 
-from memorizer import forms, models, utils
-from memorizer.cache import cache
+from memorizer import bundles, forms, history, models, serializers, utils
+from memorizer.cache import cache, course_generation, generation, generation_time, invalidate, invalidate_course
 from memorizer.config import CACHE_TIME
 from memorizer.user import get_user
 
 api = Blueprint('api', __name__)
 
+# Rows read from the database at a time when streaming
+STREAM_BATCH_SIZE = 500
+# Page size of ?after_id=&limit= pagination without a limit, and the largest allowed
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
 
 def error(message):
     return {'message': message}
 
 
 class CacheView(object):
+    def generation(self, create=True):
+        """Token that changes whenever the cached responses of the view go stale"""
+        return generation('api', create=create)
+
     def __repr__(self):
         """Hack to make memoization work with self and different get parameters"""
-        return '%s (%s)' % (self.__class__.__name__, request.args)
+        # Admins are served hidden exams as well
+        return '%s (%s) %s %s' % (
+            self.__class__.__name__, request.args, get_user().admin, self.generation(create=False)
+        )
+
+    def validators(self, create=False):
+        """ETag and Last-Modified of the response, known without building it
+
+        Nones while the view has no generation. One is only started once the view answered,
+        so requests for courses and exams that don't exist leave no tokens behind.
+        """
+        token = self.generation(create=create)
+        if token is None:
+            return None, None
+        # The url is part of it, as views share generations
+        etag = hashlib.sha1(('%s %r' % (request.path, self)).encode()).hexdigest()
+        last_modified = generation_time(token)
+        # Last-Modified has whole seconds, so until the second is over another change
+        # could get the same one and If-Modified-Since would miss it. The ETag still works
+        if last_modified.timestamp() >= int(time()):
+            last_modified = None
+        return etag, last_modified
 
 
 class JsonView(MethodView):
+    def validators(self, create=False):
+        """ETag and Last-Modified of the response, Nones if it has to be built to know"""
+        return None, None
+
     def dispatch_request(self, *args, **kwargs):
         """Returns a json document with mimetype set"""
-        return Response(
-            json.dumps(super(JsonView, self).dispatch_request(*args, **kwargs)),
-            mimetype='application/json'
-        )
+        etag, last_modified = None, None
+        if request.method in ('GET', 'HEAD'):
+            etag, last_modified = self.validators()
+        # Answered before running the view at all
+        if etag and not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+            response = Response(status=304)
+        else:
+            response = super(JsonView, self).dispatch_request(*args, **kwargs)
+            if not isinstance(response, Response):
+                response = Response(json.dumps(response), mimetype='application/json')
+            # Already prepared responses, e.g. snapshot files, may bring their own validators
+            elif response.get_etag()[0]:
+                return response
+            # The first answer since the generation was dropped, or ever, starts one
+            if not etag and request.method in ('GET', 'HEAD') and response.status_code == 200:
+                etag, last_modified = self.validators(create=True)
+        if etag:
+            response.set_etag(etag)
+            if last_modified:
+                response.last_modified = last_modified
+            # Depends on the user, and may change at any time
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            response.vary.add('Cookie')
+        return response
 
 
 # REST API
 
-class APIView(JsonView, CacheView):
+class APIView(CacheView, JsonView):
     model = None
     form = None
+    # Stream lists instead of building and caching them, for large tables
+    stream = False
+
+    def query(self):
+        return self.model.query
 
-    @cache.memoize(CACHE_TIME)
     def get(self, object_id=None):
         # Get a single object
         if object_id:
-            object = self.model.query.get_or_404(object_id)
-            return object.serialize()
+            return self.get_object(object_id)
+        # Get a page, ?after_id=<last id of previous page>&limit=<page size>, either will do
+        if 'limit' in request.args or 'after_id' in request.args:
+            return self.page_response()
         # Get all
-        else:
-            filters = {}
-            # Filtering with query string parameters
-            query = self.model.query
-            for key in request.args.keys():
-                model_columns = self.model.__table__.columns.keys()
-                if key in model_columns:
-                    value = request.args.getlist(key)
-                    # SQL IN
-                    if len(value) > 1:
-                        # Not super pretty, but it works™
-                        attr = getattr(self.model, key)
-                        query = query.filter(attr.in_(value))
-                    # SQL AND
-                    else:
-                        filters[key] = value[0]
-            objects = query.filter_by(**filters)
-            serialized_objects = [object.serialize() for object in objects]
-            return [obj for obj in serialized_objects if obj is not None]
+        if self.stream:
+            return self.stream_list()
+        return self.get_list()
+
+    @cache.memoize(CACHE_TIME)
+    def get_object(self, object_id):
+        object = self.model.query.get_or_404(object_id)
+        return object.serialize()
+
+    def filtered_query(self):
+        filters = {}
+        # Filtering with query string parameters
+        query = self.query()
+        for key in request.args.keys():
+            model_columns = self.model.__table__.columns.keys()
+            if key in model_columns:
+                value = request.args.getlist(key)
+                # SQL IN
+                if len(value) > 1:
+                    # Not super pretty, but it works™
+                    attr = getattr(self.model, key)
+                    query = query.filter(attr.in_(value))
+                # SQL AND
+                else:
+                    filters[key] = value[0]
+        return query.filter_by(**filters)
+
+    @cache.memoize(CACHE_TIME)
+    def get_list(self):
+        context = serializers.request_context()
+        serialized_objects = [object.serialize(context) for object in self.filtered_query()]
+        return [obj for obj in serialized_objects if obj is not None]
+
+    @cache.memoize(CACHE_TIME)
+    def get_page(self, after_id, limit):
+        """Returns the objects after an id and the id to continue from, if any"""
+        query = self.filtered_query().filter(self.model.id > after_id)
+        objects = query.order_by(self.model.id).limit(limit).all()
+        context = serializers.request_context()
+        serialized_objects = [object.serialize(context) for object in objects]
+        # Rows left out by serialize still count, or a page could be skipped
+        next_id = objects[-1].id if len(objects) == limit else None
+        return [obj for obj in serialized_objects if obj is not None], next_id
+
+    def page_response(self):
+        after_id = request.args.get('after_id', 0, type=int)
+        limit = min(max(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+        objects, next_id = self.get_page(after_id, limit)
+        response = Response(json.dumps(objects), mimetype='application/json')
+        if next_id is not None:
+            args = request.args.to_dict(flat=False)
+            args.update(after_id=next_id, limit=limit)
+            response.headers['Link'] = '<%s>; rel="next"' % url_for(request.endpoint, **args)
+        return response
+
+    def stream_list(self):
+        """Sends the json array while reading the rows, a batch at a time"""
+        objects = self.filtered_query().yield_per(STREAM_BATCH_SIZE)
+        context = serializers.request_context()
+
+        def generate():
+            separator = ''
+            yield '['
+            for object in objects:
+                serialized = object.serialize(context)
+                if serialized is not None:
+                    yield separator + json.dumps(serialized)
+                    separator = ','
+            yield ']'
+        return Response(stream_with_context(generate()), mimetype='application/json')
 
     def post(self):
         response = {}
@@ -77,8 +193,7 @@ class APIView(JsonView, CacheView):
             form.populate_obj(object)
             models.db.session.add(object)
             models.db.session.commit()
-            # Deleting cache
-            cache.clear()
+            self.invalidate(object.cache_scope())
         else:
             response['errors'] = form.errors
         return response
@@ -93,14 +208,15 @@ class APIView(JsonView, CacheView):
         if not object:
             response['errors'] = [error('Item not found')]
             return response
+        # The object may move to another course or exam
+        scope = object.cache_scope()
         form = self.form(request.form, obj=object)
         form.populate_obj(object)
         response['success'] = form.validate()
         if response['success']:
             models.db.session.add(object)
             models.db.session.commit()
-            # Deleting cache
-            cache.clear()
+            self.invalidate(scope, object.cache_scope())
         else:
             response['errors'] = form.errors
         return response
@@ -113,12 +229,20 @@ class APIView(JsonView, CacheView):
             return response
         object = self.model.query.get(object_id)
         if object:
+            scope = object.cache_scope()
             models.db.session.delete(object)
             models.db.session.commit()
-            # Deleting cache
-            cache.clear()
+            self.invalidate(scope)
         return {'success': bool(object)}
 
+    def invalidate(self, *scopes):
+        """Invalidates cached data for the courses and exams a write touched"""
+        for scope in scopes:
+            if scope:
+                invalidate_course(*scope)
+                bundles.schedule_rebuild(*scope)
+        invalidate('api')
+
 
 class CourseAPI(APIView):
     model = models.Course
@@ -133,11 +257,16 @@ class ExamAPI(APIView):
 class QuestionAPI(APIView):
     model = models.Question
     form = forms.QuestionForm
+    stream = True
+
+    def query(self):
+        return models.Question.serializable()
 
 
 class AlternativeAPI(APIView):
     model = models.Alternative
     form = forms.AlternativeForm
+    stream = True
 
 
 def register_api(view, endpoint, url, pk='object_id', pk_type='int'):
@@ -157,28 +286,78 @@ register_api(AlternativeAPI, 'alterative_api', '/alternatives/')
 
 # Helper apis
 
-class CourseQuestions(JsonView, CacheView):
-    @cache.memoize(CACHE_TIME)
+class CourseQuestions(CacheView, JsonView):
+    def generation(self, create=True):
+        return course_generation(request.view_args['course'], create=create)
+
     def get(self, course):
+        # Admins are served hidden exams as well, which the snapshots leave out
+        if not get_user().admin:
+            response = bundles.send_snapshot(course)
+            if response:
+                return response
+        return self.questions(course)
+
+    @cache.memoize(CACHE_TIME)
+    def questions(self, course):
         course_m = models.Course.query.filter_by(code=course).first_or_404()
-        questions = models.Question.query.filter_by(course=course_m).all()
-        serialized_objects = [question_m.serialize() for question_m in questions]
-        return [obj for obj in serialized_objects if obj is not None]
+        return bundles.questions(course_m)
 
 
-class ExamQuestions(JsonView, CacheView):
-    @cache.memoize(CACHE_TIME)
+class ExamQuestions(CacheView, JsonView):
+    def generation(self, create=True):
+        return course_generation(request.view_args['course'], request.view_args['exam'], create=create)
+
     def get(self, course, exam):
+        if not get_user().admin:
+            response = bundles.send_snapshot(course, exam)
+            if response:
+                return response
+        return self.questions(course, exam)
+
+    @cache.memoize(CACHE_TIME)
+    def questions(self, course, exam):
         course_m = models.Course.query.filter_by(code=course).first_or_404()
         exam_m = models.Exam.query.filter_by(course=course_m, name=exam).first_or_404()
-        serialized_objects = [question_m.serialize() for question_m in exam_m.questions]
-        return [obj for obj in serialized_objects if obj is not None]
+        return bundles.questions(course_m, exam_m)
 
 
 api.add_url_rule('/questions/<string:course>/all/', view_func=CourseQuestions.as_view('course_questions'))
 api.add_url_rule('/questions/<string:course>/<string:exam>/', view_func=ExamQuestions.as_view('exam_questions'))
 
 
+HISTORY_MODELS = {
+    'courses': models.Course,
+    'exams': models.Exam,
+    'questions': models.Question,
+    'alternatives': models.Alternative,
+}
+
+
+class History(JsonView):
+    def get(self, model, object_id, transaction_id=None):
+        # Same as for making the changes
+        if not get_user().registered:
+            return Response(json.dumps({'errors': [error('Not logged in')]}), status=403, mimetype='application/json')
+        if model not in HISTORY_MODELS:
+            abort(404)
+        # Changes of one version
+        if transaction_id:
+            changes = history.changeset(HISTORY_MODELS[model], object_id, transaction_id)
+            if changes is None:
+                abort(404)
+            return {'changes': changes}
+        # A page of versions, ?before=<transaction id of the last version on the previous page>
+        object = HISTORY_MODELS[model].query.get_or_404(object_id)
+        versions, before = history.versions(object, request.args.get('before', type=int))
+        return {'versions': [history.serialize(number, version) for number, version in versions], 'before': before}
+
+
+api.add_url_rule('/history/<string:model>/<int:object_id>/', view_func=History.as_view('history'))
+api.add_url_rule('/history/<string:model>/<int:object_id>/<int:transaction_id>/',
+                 view_func=History.as_view('history_changes'))
+
+
 class Stats(JsonView):
     def get(self, course_code, exam_name=None):
         return utils.generate_stats(course_code, exam_name)
@@ -215,13 +394,8 @@ class Answer(JsonView):
             # Yes/No
             answer = request.form.get('correct', False) == 'true'
             correct = question.correct == answer
-        user = get_user()
-        answered = models.Stats.answered(user, question)
-        if not answered:
-            stat = models.Stats(user, question, correct)
-            models.db.session.add(stat)
-            models.db.session.commit()
-        return {'success': not answered, 'correct': correct}
+        first = utils.record_answer(get_user(), question, correct)
+        return {'success': first, 'correct': correct}
 
 
 api.add_url_rule('/answer', view_func=Answer.as_view('answer'), methods=['POST'])
@@ -3,7 +3,8 @@ import random
 from flask import Blueprint, abort, flash, redirect, render_template, request, session, url_for
 
 from memorizer import forms, models, utils
-from memorizer.user import get_user
+from memorizer.answer_buffer import answer_buffer
+from memorizer.user import get_user, persist_user
 from memorizer.views import TemplateMethodView
 
 quiz = Blueprint('quiz', __name__)
@@ -48,7 +49,7 @@ class Register(TemplateMethodView):
         user.username = form.username.data
         user.password = form.password.data
         user.registered = True
-        models.db.session.add(user)
+        persist_user(user)
         models.db.session.commit()
 
 
@@ -92,10 +93,13 @@ def reset_stats_course(course):
     """Reset stats for a course"""
     # Check if course exists
     course = models.Course.query.filter_by(code=course).first_or_404()
+    # Buffered answers would otherwise be saved after the reset
+    answer_buffer.flush()
     stats_query = models.Stats.course(get_user(), course.code).with_entities(models.Stats.id).subquery()
     models.Stats.query.filter(models.Stats.id.in_(stats_query)).\
         update({models.Stats.reset: True}, synchronize_session=False)
     models.db.session.commit()
+    utils.clear_answered(get_user(), course)
     return redirect(url_for('quiz.course', course=course.code))
 
 
@@ -104,10 +108,12 @@ def reset_stats_exam(course, exam):
     """Reset stats for a course"""
     course = models.Course.query.filter_by(code=course).first_or_404()
     exam = models.Exam.query.filter_by(course=course, name=exam).first_or_404()
+    answer_buffer.flush()
     stats_query = models.Stats.exam(get_user(), course.code, exam.name).with_entities(models.Stats.id).subquery()
     models.Stats.query.filter(models.Stats.id.in_(stats_query)).\
         update({models.Stats.reset: True}, synchronize_session=False)
     models.db.session.commit()
+    utils.clear_answered(get_user(), course, exam)
     return redirect(url_for('quiz.exam', course=course.code, exam=exam.name))
 
 
@@ -177,11 +183,8 @@ class QuestionMixin:
             else:
                 bool_answer = answer.lower() == 'true'
                 self.success = self.question.correct == bool_answer
-            user = get_user()
-            # Checking if question has already been answered
-            if not models.Stats.answered(user, self.question):
-                self.save_answer(user, self.success)
-            elif self.success:
+            # Only the first answer to a question counts
+            if not utils.record_answer(get_user(), self.question, self.success) and self.success:
                 flash('Du har allerede svart på dette spørsmålet så du får ikke noe poeng. :-)', 'info')
         else:
             flash('Blankt svar', 'error')
@@ -216,11 +219,6 @@ class QuestionMixin:
         else:
             return answers <= correct_answers
 
-    def save_answer(self, user, success):
-        stat = models.Stats(user, self.question, success)
-        models.db.session.add(stat)
-        models.db.session.commit()
-
 
 class CourseQuestion(QuestionMixin, TemplateMethodView):
     def get(self, course_code, id, *args, **kwargs):
@@ -230,7 +228,7 @@ class CourseQuestion(QuestionMixin, TemplateMethodView):
     def context(self, *args, **kwargs):
         context = super().context(*args, **kwargs)
         reset_url = url_for('quiz.reset_stats_course', course=self.model.code)
-        random_question = utils.random_id(id=id, course=self.model.code)
+        random_question = utils.random_id(id=self.number, course=self.model.code)
 
         context.update({
             'exam_name': 'all',
@@ -254,7 +252,7 @@ class ExamQuestion(QuestionMixin, TemplateMethodView):
 
     def context(self, *args, **kwargs):
         context = super().context(*args, **kwargs)
-        random_question = utils.random_id(id=id, course=self.model.course.code)
+        random_question = utils.random_id(id=self.number, course=self.model.course.code, exam=self.model.name)
         reset_url = url_for('quiz.reset_stats_exam', course=self.model.course.code, exam=self.model.name)
 
         context.update({
@@ -0,0 +1,37 @@
+"""Add indexes for hot-path lookups
+
+Revision ID: 3c9e5b7a1f42
+Revises: 97dd2d43d5f4
+Create Date: 2026-10-18 10:12:41.305118
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3c9e5b7a1f42'
+down_revision = '97dd2d43d5f4'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_index(op.f('ix_exam_course_id'), 'exam', ['course_id'], unique=False)
+    op.create_index(op.f('ix_exam_version_course_id'), 'exam_version', ['course_id'], unique=False)
+    op.create_index(op.f('ix_question_exam_id'), 'question', ['exam_id'], unique=False)
+    op.create_index(op.f('ix_question_version_exam_id'), 'question_version', ['exam_id'], unique=False)
+    op.create_index(op.f('ix_alternative_question_id'), 'alternative', ['question_id'], unique=False)
+    op.create_index(op.f('ix_alternative_version_question_id'), 'alternative_version', ['question_id'], unique=False)
+    op.create_index(op.f('ix_stats_question_id'), 'stats', ['question_id'], unique=False)
+    # Also serves lookups on user_id alone
+    op.create_index('ix_stats_user_id_reset_question_id', 'stats', ['user_id', 'reset', 'question_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_stats_user_id_reset_question_id', table_name='stats')
+    op.drop_index(op.f('ix_stats_question_id'), table_name='stats')
+    op.drop_index(op.f('ix_alternative_version_question_id'), table_name='alternative_version')
+    op.drop_index(op.f('ix_alternative_question_id'), table_name='alternative')
+    op.drop_index(op.f('ix_question_version_exam_id'), table_name='question_version')
+    op.drop_index(op.f('ix_question_exam_id'), table_name='question')
+    op.drop_index(op.f('ix_exam_version_course_id'), table_name='exam_version')
+    op.drop_index(op.f('ix_exam_course_id'), table_name='exam')
@@ -0,0 +1,28 @@
+"""Allow one active answer per user and question
+
+Revision ID: 8f2d4c61b0e3
+Revises: 3c9e5b7a1f42
+Create Date: 2026-10-18 14:03:27.518842
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '8f2d4c61b0e3'
+down_revision = '3c9e5b7a1f42'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    # Only the first of duplicate answers ever counted
+    op.execute(
+        'DELETE FROM stats WHERE NOT reset AND id NOT IN '
+        '(SELECT MIN(id) FROM stats WHERE NOT reset GROUP BY user_id, question_id)'
+    )
+    op.create_index('uq_stats_user_id_question_id_active', 'stats', ['user_id', 'question_id'], unique=True,
+                    sqlite_where=sa.text('NOT reset'), postgresql_where=sa.text('NOT reset'))
+
+
+def downgrade():
+    op.drop_index('uq_stats_user_id_question_id_active', table_name='stats')
@@ -0,0 +1,27 @@
+"""Add transaction meta for unversioned imports
+
+Revision ID: c71e0a9d5b28
+Revises: 8f2d4c61b0e3
+Create Date: 2026-10-18 16:40:12.093551
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'c71e0a9d5b28'
+down_revision = '8f2d4c61b0e3'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('transaction_meta',
+    sa.Column('transaction_id', sa.BigInteger(), nullable=False),
+    sa.Column('key', sa.Unicode(length=255), nullable=False),
+    sa.Column('value', sa.UnicodeText(), nullable=True),
+    sa.PrimaryKeyConstraint('transaction_id', 'key')
+    )
+
+
+def downgrade():
+    op.drop_table('transaction_meta')
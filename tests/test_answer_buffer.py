@@ -0,0 +1,76 @@
+from unittest.mock import patch
+
+from flask import url_for
+
+from memorizer.answer_buffer import answer_buffer
+from memorizer.cache import cache
+from memorizer.database import db
+from memorizer.models import Stats
+from memorizer.utils import generate_stats
+from tests import DatabaseTestCase
+from tests.models_mock import add_course, add_exam, add_question_boolean
+
+
+class AnswerBufferTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        # Flushed by the tests themselves
+        self.app.config.update(ANSWER_BUFFER=True, ANSWER_BUFFER_FLUSH_MS=60 * 1000)
+        answer_buffer.init_app(self.app)
+        self.user = self.mock_user(save=True)
+        self.course = add_course()
+        self.exam = add_exam(self.course)
+        self.questions = [add_question_boolean(self.exam, text="Question %d" % i, correct=True) for i in range(3)]
+
+    def tearDown(self):
+        self.app.config['ANSWER_BUFFER'] = False
+        answer_buffer.init_app(self.app)
+        super().tearDown()
+
+    def answer(self, question, correct):
+        data = {'question': question.id, 'correct': 'true' if correct else 'false'}
+        return self.client.post(url_for('api.answer'), data=data).json
+
+    def test_buffered(self):
+        self.assertTrue(self.answer(self.questions[0], True)['success'])
+        self.assertFalse(self.answer(self.questions[0], False)['success'])
+        self.assertEqual(Stats.query.count(), 0)
+
+        answer_buffer.flush()
+        self.assertEqual([stat.correct for stat in Stats.query], [True])
+        self.assertFalse(self.answer(self.questions[0], True)['success'])
+
+    def test_stats_include_pending(self):
+        self.answer(self.questions[0], False)
+        answer_buffer.flush()
+        self.answer(self.questions[1], True)
+        self.answer(self.questions[2], True)
+        for exam_name in (None, self.exam.name):
+            stats = generate_stats(self.course.code, exam_name)
+            self.assertEqual((stats['total'], stats['points'], stats['combo']), (3, 2, 2))
+        answer_buffer.flush()
+        stats = generate_stats(self.course.code)
+        self.assertEqual((stats['total'], stats['points'], stats['combo']), (3, 2, 2))
+
+    def test_full_buffer_saves_directly(self):
+        self.app.config['ANSWER_BUFFER_MAX'] = 1
+        answer_buffer.init_app(self.app)
+        self.answer(self.questions[0], True)
+        self.answer(self.questions[1], True)
+        self.assertEqual(Stats.query.count(), 1)
+        answer_buffer.flush()
+        self.assertEqual(Stats.query.count(), 2)
+
+    @patch('memorizer.models.Stats.record_many', side_effect=Exception('Batch failed'))
+    def test_failed_batch(self, record_many_patch):
+        self.answer(self.questions[0], True)
+        self.answer(self.questions[1], False)
+        # Can never be saved
+        db.session.delete(self.questions[1])
+        db.session.commit()
+        with self.assertLogs('memorizer.answer_buffer', 'ERROR'):
+            answer_buffer.flush()
+        self.assertEqual([(stat.question_id, stat.correct) for stat in Stats.query], [(self.questions[0].id, True)])
+        self.assertEqual(answer_buffer.pending, [])
+        self.assertEqual(answer_buffer.keys, set())
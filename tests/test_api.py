@@ -1,5 +1,18 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from time import time
+from unittest.mock import patch
+
 from flask import url_for
+from werkzeug.http import http_date
+from sqlalchemy import event
 
+from memorizer import bundles, history, models
+from memorizer.cache import cache, course_generation, generation, generation_time
+from memorizer.database import db
 from tests import DatabaseTestCase
 from tests.models_mock import add_course, add_exam, add_question_boolean, add_question_multiple
 
@@ -97,3 +110,361 @@ class QuestionTest(DatabaseTestCase):
 
         self.assert200(response)
         self.assertTrue(response.json['correct'], 'Answer is correct')
+
+
+class CacheInvalidationTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.mock_user(registered=True)
+        self.course = add_course()
+        self.exam = add_exam(self.course)
+        self.other_exam = add_exam(self.course, name="H16")
+        self.question = add_question_multiple(
+            self.exam, text="Question", alternatives=[('Alt 1', True), ('Alt 2', False)]
+        )
+        self.other_course = add_course(code="OTHER")
+        add_question_boolean(add_exam(self.other_course), text="Other question")
+
+    def test_put_invalidates_affected_course(self):
+        url = url_for('api.course_questions', course=self.course.code)
+        self.client.get(url)
+        other_course = course_generation(self.other_course.code)
+        other_exam = course_generation(self.course.code, self.other_exam.name)
+        alternative = self.question.alternatives[0]
+
+        response = self.client.put(
+            url_for('api.alterative_api', object_id=alternative.id),
+            data={'text': 'Changed', 'correct': 'y', 'question_id': self.question.id}
+        )
+
+        self.assertTrue(response.json['success'])
+        self.assertEqual(course_generation(self.other_course.code), other_course)
+        self.assertEqual(course_generation(self.course.code, self.other_exam.name), other_exam)
+        texts = [alt['text'] for alt in self.client.get(url).json[0]['alternatives']]
+        self.assertIn('Changed', texts)
+
+    def test_full_cache_keeps_generations(self):
+        token = course_generation(self.course.code)
+        # Past the threshold of SimpleCache, which then prunes the entries expiring first
+        for i in range(600):
+            cache.set('filler/%d' % i, i)
+        self.assertEqual(course_generation(self.course.code), token)
+
+    def test_missing_course_leaves_no_generation(self):
+        self.assert404(self.client.get(url_for('api.course_questions', course='MISSING')))
+        self.assert404(self.client.get(url_for('api.exam_questions', course=self.course.code, exam='MISSING')))
+        self.assertIsNone(course_generation('MISSING', create=False))
+        self.assertIsNone(course_generation(self.course.code, 'MISSING', create=False))
+
+    def test_hiding_exam_invalidates_course(self):
+        url = url_for('api.course_questions', course=self.course.code)
+        self.assertEqual(len(self.client.get(url).json), 1)
+        admin = self.mock_user(registered=True, save=True)
+        admin.admin = True
+
+        self.client.put(
+            url_for('api.exam_api', object_id=self.exam.id),
+            data={'name': self.exam.name, 'course_id': self.course.id, 'hidden': 'y'}
+        )
+
+        self.mock_user()
+        self.assertEqual(self.client.get(url).json, [])
+
+
+class QuestionBundleTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.mock_user(save=True)
+        self.course = add_course()
+        self.exam = add_exam(self.course)
+
+    def add_questions(self, count):
+        for i in range(count):
+            add_question_multiple(self.exam, text="Question %d" % i, alternatives=[('Alt 1', True), ('Alt 2', False)])
+            add_question_boolean(self.exam, text="Boolean %d" % i, image="image.png")
+
+    def count_queries(self, url):
+        cache.clear()
+        statements = []
+
+        def count(*args):
+            statements.append(args)
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            response = self.client.get(url)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+        self.assert200(response)
+        return len(statements), response.json
+
+    def test_constant_queries(self):
+        for url in (
+            url_for('api.course_questions', course=self.course.code),
+            url_for('api.exam_questions', course=self.course.code, exam=self.exam.name),
+        ):
+            self.add_questions(2)
+            few, _ = self.count_queries(url)
+            self.add_questions(10)
+            many, questions = self.count_queries(url)
+            self.assertEqual(few, many)
+            self.assertEqual(len(questions[0]['alternatives']), 2)
+            self.assertNotIn('question_id', questions[0]['alternatives'][0])
+            self.assertEqual(questions[1]['image'], '/static/img/TEST/image.png')
+
+
+class SnapshotTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        self.app.config['SNAPSHOT_DIR'] = self.directory
+        self.mock_user()
+        self.course = add_course()
+        self.exam = add_exam(self.course)
+        add_question_boolean(self.exam, text="Question", image="image.png")
+        bundles.rebuild_snapshots(self.course.code, [self.exam.name])
+        self.url = url_for('api.exam_questions', course=self.course.code, exam=self.exam.name)
+
+    def tearDown(self):
+        self.app.config['SNAPSHOT_DIR'] = None
+        shutil.rmtree(self.directory)
+        super().tearDown()
+
+    def get(self, url, **headers):
+        return self.client.get(url, headers=dict({'Accept-Encoding': 'gzip'}, **headers))
+
+    def test_serves_snapshot(self):
+        for url in (url_for('api.course_questions', course=self.course.code), self.url):
+            response = self.get(url)
+            self.assert200(response)
+            self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+            self.assertTrue(response.headers['ETag'])
+            response.direct_passthrough = False
+            questions = json.loads(gzip.decompress(response.data))
+            # Same bundle as the one built per request
+            self.assertEqual(questions, self.client.get(url).json)
+            self.assertEqual(questions[0]['image'], '/static/img/TEST/image.png')
+
+    def test_not_modified(self):
+        etag = self.get(self.url).headers['ETag']
+        self.assertEqual(self.get(self.url, **{'If-None-Match': etag}).status_code, 304)
+
+    def test_files(self):
+        bundles.rebuild_snapshots(self.course.code, [self.exam.name])
+        # One pointer and one content file each, no temporary files left behind
+        self.assertEqual(len(os.listdir(self.directory)), 4)
+
+    def test_expired(self):
+        path = bundles.snapshot_path(self.course.code, self.exam.name)
+        os.utime(path, (0, 0))
+        self.assertNotIn('Content-Encoding', self.get(self.url).headers)
+        # Built again
+        self.assertEqual(self.get(self.url).headers['Content-Encoding'], 'gzip')
+
+    @patch('memorizer.bundles.SnapshotBuilder._start')
+    def test_background_rebuild(self, start_patch):
+        self.app.config['SNAPSHOT_BACKGROUND'] = True
+        bundles.schedule_rebuild(self.course.code, [self.exam.name])
+        # Stale ones are gone at once, bundles are built per request until the new ones are there
+        self.assertIsNone(bundles.send_snapshot(self.course.code, self.exam.name))
+        self.assertNotIn('Content-Encoding', self.get(self.url).headers)
+        bundles.snapshot_builder.build()
+        self.assertEqual(self.get(self.url).headers['Content-Encoding'], 'gzip')
+
+    def test_admin_edit_rebuilds(self):
+        etag = self.get(self.url).headers['ETag']
+        admin = self.mock_user(registered=True, save=True)
+        admin.admin = True
+        self.client.put(
+            url_for('api.exam_api', object_id=self.exam.id),
+            data={'name': self.exam.name, 'course_id': self.course.id, 'hidden': 'y'}
+        )
+        # Admins get hidden exams built per request
+        self.assertNotIn('Content-Encoding', self.get(self.url).headers)
+
+        self.mock_user()
+        self.assertIsNone(bundles.send_snapshot(self.course.code, self.exam.name))
+        response = self.get(url_for('api.course_questions', course=self.course.code))
+        response.direct_passthrough = False
+        self.assertEqual(json.loads(gzip.decompress(response.data)), [])
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+
+class ConditionalGetTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.mock_user(registered=True)
+        self.course = add_course()
+        self.url = url_for('api.course_api')
+
+    @patch('memorizer.views.api.time', side_effect=lambda: time() + 2)
+    def test_not_modified(self, time_patch):
+        response = self.client.get(self.url)
+        self.assert200(response)
+        etag, last_modified = response.headers['ETag'], response.headers['Last-Modified']
+
+        response = self.client.get(self.url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        response = self.client.get(self.url, headers={'If-Modified-Since': last_modified})
+        self.assertEqual(response.status_code, 304)
+
+    def test_same_second(self):
+        token = generation('api')
+        with patch('memorizer.views.api.time', return_value=int(token.split('.')[0], 16) + 0.5):
+            response = self.client.get(self.url)
+            self.assertNotIn('Last-Modified', response.headers)
+            # A later change in the same second would have the same Last-Modified
+            response = self.client.get(self.url, headers={'If-Modified-Since': http_date(generation_time(token))})
+            self.assert200(response)
+
+    def test_modified(self):
+        etag = self.client.get(self.url).headers['ETag']
+        self.client.post(self.url, data={'code': 'NEW', 'name': 'New course'})
+
+        response = self.client.get(self.url, headers={'If-None-Match': etag})
+        self.assert200(response)
+        self.assertEqual(len(response.json), 2)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_depends_on_url(self):
+        etag = self.client.get(self.url).headers['ETag']
+        self.assertNotEqual(self.client.get(self.url + '?code=TEST').headers['ETag'], etag)
+        response = self.client.get(url_for('api.course_api', object_id=self.course.id), headers={'If-None-Match': etag})
+        self.assert200(response)
+
+
+class StreamingListTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.mock_user()
+        self.course = add_course()
+        self.exam = add_exam(self.course)
+        self.other_exam = add_exam(self.course, name="H16")
+        for i in range(5):
+            add_question_multiple(self.exam, text="Question %d" % i, alternatives=[('Alt 1', True), ('Alt 2', False)])
+        add_question_boolean(self.other_exam, text="Other question")
+
+    @patch('memorizer.views.api.STREAM_BATCH_SIZE', 2)
+    def test_questions(self):
+        response = self.client.get(url_for('api.question_api'))
+        self.assertTrue(response.is_streamed)
+        questions = response.json
+        self.assertEqual([question['text'] for question in questions[:5]], ["Question %d" % i for i in range(5)])
+        self.assertEqual(len(questions[0]['alternatives']), 2)
+        self.assertEqual(len(questions), 6)
+
+    def test_filters(self):
+        response = self.client.get(url_for('api.question_api', exam_id=self.other_exam.id))
+        self.assertEqual([question['text'] for question in response.json], ["Other question"])
+        response = self.client.get(url_for('api.alterative_api', text=['Alt 1', 'Missing']))
+        self.assertEqual(len(response.json), 5)
+
+    def test_empty(self):
+        response = self.client.get(url_for('api.question_api', exam_id=0))
+        self.assertEqual(response.json, [])
+
+
+class PaginationTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.mock_user()
+        self.course = add_course()
+        self.exam = add_exam(self.course)
+        self.other_exam = add_exam(self.course, name="H16")
+        for i in range(5):
+            add_question_boolean(self.exam, text="Question %d" % i)
+            add_question_boolean(self.other_exam, text="Other %d" % i)
+
+    def walk(self, url):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assert200(response)
+            pages.append([question['text'] for question in response.json])
+            link = response.headers.get('Link')
+            url = link[1:link.index('>')] if link else None
+        return pages
+
+    def test_pages(self):
+        pages = self.walk(url_for('api.question_api', exam_id=self.exam.id, limit=2))
+        self.assertEqual(pages, [["Question 0", "Question 1"], ["Question 2", "Question 3"], ["Question 4"]])
+
+    def test_in_filter(self):
+        url = url_for('api.question_api', exam_id=[self.exam.id, self.other_exam.id], limit=4)
+        pages = self.walk(url)
+        self.assertEqual([len(page) for page in pages], [4, 4, 2])
+        texts = [question['text'] for question in self.client.get(url_for('api.question_api')).json]
+        self.assertEqual(sum(pages, []), texts)
+
+    def test_after_id(self):
+        courses = self.client.get(url_for('api.course_api', after_id=self.course.id, limit=10))
+        self.assertEqual(courses.json, [])
+        self.assertNotIn('Link', courses.headers)
+
+    @patch('memorizer.views.api.DEFAULT_PAGE_SIZE', 3)
+    def test_after_id_without_limit(self):
+        first = models.Question.query.order_by(models.Question.id).first()
+        response = self.client.get(url_for('api.question_api', after_id=first.id))
+        self.assertEqual([question['id'] for question in response.json], [first.id + 1, first.id + 2, first.id + 3])
+        self.assertIn('limit=3', response.headers['Link'])
+        self.assertEqual(sum(self.walk(url_for('api.question_api', after_id=0)), []), [
+            question['text'] for question in self.client.get(url_for('api.question_api')).json
+        ])
+
+
+class HistoryTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = self.mock_user(registered=True, save=True)
+        self.admin.admin = True
+        self.question = add_question_boolean(add_exam(add_course()), text="Version 1")
+        for i in range(2, 13):
+            self.question.text = "Version %d" % i
+            db.session.commit()
+        self.url = url_for('api.history', model='questions', object_id=self.question.id)
+
+    def test_pages(self):
+        first = self.client.get(self.url).json
+        self.assertEqual([version['number'] for version in first['versions']], list(range(12, 2, -1)))
+        self.assertEqual(first['versions'][0]['user'], self.admin.username)
+        second = self.client.get(self.url, query_string={'before': first['before']}).json
+        self.assertEqual([version['number'] for version in second['versions']], [2, 1])
+        self.assertIsNone(second['before'])
+
+    def test_changes(self):
+        version = self.client.get(self.url).json['versions'][0]
+        url = url_for('api.history_changes', model='questions', object_id=self.question.id,
+                      transaction_id=version['transaction_id'])
+        self.assertEqual(self.client.get(url).json['changes'], [['text', 'Version 11', 'Version 12']])
+
+    def test_batched_loads(self):
+        statements = []
+
+        def count(*args):
+            statements.append(args)
+        db.session.expire_all()
+        # Reloaded after expire_all, not part of the history queries
+        self.question.id
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            versions, _ = history.versions(self.question)
+            users = [version.transaction.user for number, version in versions]
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+        self.assertEqual(users, [self.admin] * 10)
+        # Counting and the page with its transactions and users
+        self.assertEqual(len(statements), 2)
+
+    def test_registered_only(self):
+        self.admin.admin = False
+        self.assert200(self.client.get(self.url))
+        self.admin.registered = False
+        response = self.client.get(self.url)
+        self.assert403(response)
+        self.assertIn('errors', response.json)
@@ -1,5 +1,11 @@
+import os
+import tempfile
+
 from flask import Flask
+from sqlalchemy import create_engine, text
 
+from memorizer.application import create_app
+from memorizer.database import configure_sqlite, db
 from tests import MemorizerTestCase
 
 
@@ -7,3 +13,22 @@ class ApplicationTest(MemorizerTestCase):
     def test_create_app(self):
         app = self.create_app()
         self.assertIsInstance(app, Flask)
+
+    def test_sqlite_pragmas(self):
+        engine = create_engine('sqlite://')
+        configure_sqlite(engine, {'busy_timeout': 1234, 'synchronous': 'NORMAL'})
+        with engine.connect() as connection:
+            self.assertEqual(connection.execute(text('PRAGMA busy_timeout')).scalar(), 1234)
+            # NORMAL
+            self.assertEqual(connection.execute(text('PRAGMA synchronous')).scalar(), 1)
+
+    def test_pool_sizing_in_memory(self):
+        with tempfile.TemporaryDirectory() as directory:
+            config_path = os.path.join(directory, 'config.py')
+            with open(config_path, 'w') as file:
+                file.write('from tests.config import *  # NOQA\n')
+                file.write("SQLALCHEMY_ENGINE_OPTIONS = {'pool_size': 10, 'max_overflow': 20}\n")
+            app = create_app(config_path)
+        with app.app_context():
+            with db.engine.connect() as connection:
+                self.assertEqual(connection.execute(text('SELECT 1')).scalar(), 1)
@@ -0,0 +1,92 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from flask import url_for
+from sqlalchemy import create_engine, text, update
+
+from memorizer.application import create_app
+from memorizer.database import READ_BIND, db
+from memorizer.models import Stats
+from tests import DatabaseTestCase
+from tests.models_mock import add_course, add_exam, add_question_boolean
+
+
+class ReadRoutingTest(DatabaseTestCase):
+    def create_app(self):
+        # The read engine needs a database file to share
+        self.directory = tempfile.mkdtemp()
+        path = os.path.join(self.directory, 'memorizer.db')
+        config_path = os.path.join(self.directory, 'config.py')
+        with open(config_path, 'w') as file:
+            file.write('from tests.config import *  # NOQA\n')
+            file.write('SQLALCHEMY_DATABASE_URI = %r\n' % ('sqlite:///' + path))
+            file.write('SQLALCHEMY_BINDS = %r\n' % {READ_BIND: 'sqlite:///file:%s?mode=ro&uri=true' % path})
+            file.write("SQLITE_PRAGMAS = {'journal_mode': 'WAL'}\n")
+        return create_app(config_path)
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.directory)
+
+    def test_get_bind(self):
+        read, primary = db.engines[READ_BIND], db.engines[None]
+        with self.app.test_request_context(method='GET'):
+            self.assertIs(db.session.get_bind(), read)
+            self.assertIs(db.session.get_bind(clause=update(Stats)), primary)
+        with self.app.test_request_context(method='POST'):
+            self.assertIs(db.session.get_bind(), primary)
+
+    def test_requests(self):
+        self.mock_user(save=True)
+        course = add_course()
+        add_question_boolean(add_exam(course), text="Question")
+        self.assertEqual([course['code'] for course in self.client.get(url_for('api.course_api')).json], ['TEST'])
+
+        self.client.post(url_for('api.answer'), data={'question': 1, 'correct': 'true'})
+        self.assertEqual(Stats.query.count(), 1)
+        # Resetting is a GET request writing to the database
+        self.client.get(url_for('quiz.reset_stats_course', course=course.code))
+        self.assertEqual(Stats.query.filter_by(reset=False).count(), 0)
+
+
+class ProductionConfigTest(TestCase):
+    """The shipped config, with its read-only engine, on a database file of its own"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'memorizer.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def create_app(self):
+        config_path = os.path.join(self.directory, 'config.py')
+        with open(config_path, 'w') as file:
+            file.write('from memorizer.config import *  # NOQA\n')
+            file.write('TESTING = True\n')
+            # Only the database is set, the read engine follows it
+            file.write('SQLALCHEMY_DATABASE_URI = %r\n' % ('sqlite:///' + self.path))
+        return create_app(config_path)
+
+    def test_read_bind(self):
+        app = self.create_app()
+        self.assertEqual(app.config['SQLALCHEMY_BINDS'], {READ_BIND: 'sqlite:///file:%s?mode=ro&uri=true' % self.path})
+
+    def test_rollback_journal(self):
+        # Made before WAL was used, with the default journal
+        engine = create_engine('sqlite:///' + self.path)
+        db.metadata.create_all(engine)
+        engine.dispose()
+        app = self.create_app()
+        # The first request reads through the read-only engine
+        response = app.test_client().get('/api/courses/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, [])
+
+    def test_missing_file(self):
+        app = self.create_app()
+        with app.app_context():
+            with db.engines[READ_BIND].connect() as connection:
+                self.assertEqual(connection.execute(text('PRAGMA journal_mode')).scalar(), 'wal')
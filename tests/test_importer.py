@@ -1,6 +1,12 @@
+import json
+import os
+import tempfile
 from unittest import TestCase
 from unittest.mock import call, patch
 
+from click.testing import CliRunner
+from sqlalchemy_continuum import version_class, versioning_manager
+
 from memorizer import importer, models
 from tests import DatabaseTestCase
 
@@ -21,6 +27,11 @@ class ValidateQuestions(TestCase):
         with self.assertRaises(importer.ValidationError):
             importer.validate_questions({'questions': []})
 
+    def test_not_dict(self):
+        for question in ('oops', None, ['question']):
+            with self.assertRaises(importer.ValidationError):
+                importer.validate_questions({'questions': [question]})
+
     @patch('memorizer.importer.validate_question', side_effect=importer.ValidationError)
     def test_invalid_question(self, test_patch):
         with self.assertRaises(importer.ValidationError):
@@ -165,8 +176,8 @@ class ImportCommandTest(TestCase):
 
 
 class JsonImportTest(DatabaseTestCase):
-    def test_import_exam(self):
-        exam = {
+    def exam_json(self):
+        return {
             "name": "Innføring i medisin for ikke-medisinere",
             "code": "MFEL1010",
             "exam": "H10",
@@ -201,7 +212,10 @@ class JsonImportTest(DatabaseTestCase):
                 }
             ]
         }
-        importer.import_exam(exam)
+
+    def test_import_exam(self):
+        exam = self.exam_json()
+        self.assertEqual(importer.import_exam(exam), 12)
         assert models.Question.query.count() == len(exam['questions'])
         exam_obj = models.Exam.query.first()
         self.assertEqual(exam_obj.name, exam['exam'])
@@ -211,6 +225,37 @@ class JsonImportTest(DatabaseTestCase):
         for question in exam['questions']:
             self.validate_question(question)
 
+    def test_bulk_import_exam(self):
+        exam = self.exam_json()
+        self.assertEqual(importer.import_exam(exam, bulk=True), 12)
+        self.assertEqual(models.Question.query.count(), len(exam['questions']))
+        for question in exam['questions']:
+            self.validate_question(question)
+        # History is written for the batched inserts as well
+        question = models.Question.query.first()
+        self.assertEqual(question.versions.count(), 1)
+        self.assertEqual(question.alternatives[0].versions.count(), 1)
+
+    @patch('memorizer.importer.import_question', side_effect=[1, RuntimeError])
+    def test_rollback(self, import_patch):
+        with self.assertRaises(RuntimeError):
+            importer.import_exam(self.exam_json())
+        self.assertEqual(models.Course.query.count(), 0)
+        self.assertEqual(models.Question.query.count(), 0)
+
+    def test_import_exams(self):
+        exam = self.exam_json()
+        other = dict(self.exam_json(), exam="V11")
+        self.assertEqual(importer.import_exams([exam, other]), 24)
+        self.assertEqual(models.Exam.query.count(), 2)
+        self.assertEqual(models.Alternative.query.count(), 16)
+
+    def test_import_exams_rollback(self):
+        invalid = dict(self.exam_json(), questions=[])
+        with self.assertRaises(importer.ValidationError):
+            importer.import_exams([self.exam_json(), invalid])
+        self.assertEqual(models.Question.query.count(), 0)
+
     def validate_question(self, question):
         obj = models.Question.query.filter_by(text=question['question']).first()
         self.assertIsNotNone(obj)
@@ -229,3 +274,59 @@ class JsonImportTest(DatabaseTestCase):
         else:
             correct = index == correct_answer
         self.assertEqual(correct, alternative.correct)
+
+
+class ImportQuestionsTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        super().tearDown()
+        self.directory.cleanup()
+
+    def write(self, name, content):
+        filename = os.path.join(self.directory.name, name)
+        with open(filename, 'w') as file:
+            file.write(content)
+        return filename
+
+    def exam_file(self, name, exam):
+        return self.write(name, json.dumps({
+            'code': 'TEST', 'name': 'Test', 'exam': exam,
+            'questions': [{'question': 'Question', 'answer': True}]
+        }))
+
+    def test_import(self):
+        filenames = [self.exam_file('v16.json', 'V16'), self.exam_file('h16.json', 'H16')]
+        result = CliRunner().invoke(importer.import_questions, ['--jobs', '2'] + filenames)
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(models.Exam.query.count(), 2)
+
+    def test_reports_all_errors(self):
+        filenames = [
+            self.exam_file('v16.json', 'V16'),
+            self.write('broken.json', '{'),
+            self.write('invalid.json', '{"code": "TEST"}'),
+            self.write('entries.json', '{"code": "TEST", "name": "Test", "exam": "H17", "questions": ["oops"]}'),
+        ]
+        result = CliRunner().invoke(importer.import_questions, ['--bulk'] + filenames)
+        self.assertNotEqual(result.exit_code, 0)
+        self.assertIn('broken.json', result.output)
+        self.assertIn('invalid.json', result.output)
+        self.assertIn('entries.json', result.output)
+        self.assertEqual(models.Question.query.count(), 0)
+
+    def test_unversioned(self):
+        filenames = [self.exam_file('v16.json', 'V16'), self.exam_file('h16.json', 'H16')]
+        for options in ([], ['--bulk']):
+            result = CliRunner().invoke(importer.import_questions, ['--unversioned'] + options + filenames)
+            self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(models.Question.query.count(), 4)
+        self.assertTrue(versioning_manager.options['versioning'])
+        for model in (models.Course, models.Exam, models.Question):
+            self.assertEqual(version_class(model).query.count(), 0)
+        transactions = versioning_manager.transaction_cls.query.all()
+        self.assertEqual([transaction.meta for transaction in transactions], [
+            {'description': 'Imported v16.json, h16.json'}
+        ] * 2)
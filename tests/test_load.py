@@ -0,0 +1,51 @@
+import random
+import sqlite3
+import time
+from unittest import TestCase
+
+from click.testing import CliRunner
+from flask import appcontext_tearing_down
+
+from memorizer import load, models
+from tests import DatabaseTestCase
+from tests.models_mock import add_course, add_exam, add_question_boolean
+
+
+class ReportTest(TestCase):
+    def test_percentile(self):
+        samples = list(range(1, 101))
+        self.assertEqual([load.percentile(samples, percent) for percent in (50, 95, 99)], [50, 95, 99])
+        self.assertEqual(load.percentile([7], 99), 7)
+
+    def test_error_kind(self):
+        self.assertIsNone(load.error_kind(200))
+        self.assertEqual(load.error_kind(404), 'HTTP 404')
+        self.assertEqual(load.error_kind(exception=sqlite3.OperationalError('database is locked')), 'sqlite locked')
+        self.assertEqual(load.error_kind(exception=ConnectionRefusedError()), 'ConnectionRefusedError')
+
+
+class LoadCommandTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        exam = add_exam(add_course())
+        for number in range(3):
+            add_question_boolean(exam, text='Question %d' % number)
+
+    def test_run(self):
+        # In-memory SQLite has a single connection, so a single student
+        result = CliRunner().invoke(load.load, ['--students', '1', '--duration', '0.3'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        for endpoint in ('answer', 'bundle', 'courses', 'question'):
+            self.assertIn(endpoint, result.output)
+        self.assertNotIn(' x ', result.output)
+        self.assertGreater(models.Stats.query.count(), 0)
+
+    def test_context_per_request(self):
+        results = load.Results()
+        torn_down = []
+        with appcontext_tearing_down.connected_to(lambda sender, **extra: torn_down.append(sender), self.app):
+            # With the test's own app context pushed, which the requests must not share
+            load.student(load.WSGIClient(self.app), results, time.monotonic() + 0.2, random.Random(0),
+                         load.build_paths())
+        self.assertEqual(len(torn_down), sum(len(latencies) for latencies in results.latencies.values()))
+        self.assertGreater(len(torn_down), 1)
@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+
+from flask import url_for
+
+from memorizer.application import create_app
+from tests import DatabaseTestCase
+from tests.models_mock import add_course, add_exam, add_question_boolean
+
+
+class MetricsTest(DatabaseTestCase):
+    def create_app(self):
+        self.directory = tempfile.mkdtemp()
+        config_path = os.path.join(self.directory, 'config.py')
+        with open(config_path, 'w') as file:
+            file.write('from tests.config import *  # NOQA\n')
+            file.write('METRICS = True\n')
+            file.write('METRICS_HEADERS = True\n')
+            file.write('METRICS_TOKEN = "token"\n')
+        app = create_app(config_path)
+
+        @app.route('/fail')
+        def fail():
+            raise RuntimeError('Failed')
+        return app
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.directory)
+
+    def setUp(self):
+        super().setUp()
+        self.mock_user(save=True)
+        self.course = add_course()
+        add_question_boolean(add_exam(self.course), text="Question")
+
+    def test_headers(self):
+        response = self.client.get(url_for('quiz.question_course', course_code=self.course.code, id=1))
+        self.assert200(response)
+        self.assertGreater(int(response.headers['X-Query-Count']), 0)
+        self.assertRegex(response.headers['Server-Timing'], r'^db;dur=[\d.]+, render;dur=[\d.]+, total;dur=[\d.]+$')
+        self.assertNotEqual(response.headers['Server-Timing'].split(', ')[1], 'render;dur=0.00')
+
+    def test_metrics(self):
+        url = url_for('api.course_questions', course=self.course.code)
+        self.client.get(url)
+        self.client.get(url)
+        response = self.client.get('/metrics')
+        self.assert200(response)
+        text = response.get_data(as_text=True)
+        self.assertIn('# TYPE memorizer_request_queries histogram', text)
+        self.assertIn('memorizer_request_queries_count{endpoint="api.course_questions"}', text)
+        self.assertIn('memorizer_request_duration_seconds_bucket{endpoint="api.course_questions",le="+Inf"}', text)
+        self.assertIn('memorizer_cache_requests_total{kind="memoize",result="hit"}', text)
+        self.assertIn('memorizer_cache_requests_total{kind="memoize",result="miss"}', text)
+
+    def test_failed_request(self):
+        with self.assertRaises(RuntimeError):
+            self.client.get('/fail')
+        text = self.client.get('/metrics').get_data(as_text=True)
+        self.assertIn('memorizer_request_queries_count{endpoint="fail"} 1', text)
+
+    def test_access(self):
+        remote = {'REMOTE_ADDR': '192.0.2.1'}
+        self.assert403(self.client.get('/metrics', environ_base=remote))
+        self.assert403(self.client.get('/metrics', environ_base=remote, headers={'Authorization': 'Bearer wrong'}))
+        self.assert200(self.client.get('/metrics', environ_base=remote, headers={'Authorization': 'Bearer token'}))
+
+    def test_headers_per_app(self):
+        config_path = os.path.join(self.directory, 'other_config.py')
+        with open(config_path, 'w') as file:
+            file.write('from tests.config import *  # NOQA\n')
+            file.write('METRICS = True\n')
+        # Without the headers itself, but doesn't turn them off for this app
+        create_app(config_path)
+        self.assertIn('X-Query-Count', self.client.get(url_for('api.course_api')).headers)
+
+
+class MetricsDisabledTest(DatabaseTestCase):
+    def test_disabled(self):
+        response = self.client.get(url_for('api.course_api'))
+        self.assertNotIn('X-Query-Count', response.headers)
+        self.assertNotIn('metrics', self.app.view_functions)
@@ -1,7 +1,9 @@
+from memorizer.cache import cache
 from memorizer.database import db
-from memorizer import models
+from memorizer import importer, models
 
 from tests import DatabaseTestCase
+from tests.models_mock import add_course, add_exam, add_question_boolean
 
 
 class ModelTestCase:
@@ -110,3 +112,59 @@ class TestStatsModel(ModelTestCase, DatabaseTestCase):
 
     def edit(self, stats):
         stats.correct = True
+
+
+class TestQuestionPosition(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.course = add_course()
+        self.hidden = add_exam(self.course, name="H15")
+        self.hidden.hidden = True
+        self.exam = add_exam(self.course, name="V16")
+        self.hidden_question = add_question_boolean(self.hidden, text="Hidden")
+        self.questions = [add_question_boolean(self.exam, text="Question %d" % i) for i in range(3)]
+
+    def test_course_question(self):
+        self.assertEqual(self.course.question_count, 3)
+        for position, question in enumerate(self.questions, 1):
+            self.assertEqual(self.course.question(position).first(), question)
+        self.assertIsNone(self.course.question(0).first())
+        self.assertIsNone(self.course.question(4).first())
+
+    def test_exam_question(self):
+        self.assertEqual(self.exam.question(2).first(), self.questions[1])
+        self.assertIsNone(self.hidden.question(1))
+
+    def test_added_question(self):
+        self.assertIsNone(self.course.question(4).first())
+        exam = {'code': self.course.code, 'name': self.course.name, 'exam': self.exam.name,
+                'questions': [{'question': 'Imported', 'answer': True}]}
+        importer.import_exam(exam)
+        self.assertEqual(self.course.question(4).first().text, 'Imported')
+
+    def test_index(self):
+        self.assertEqual([question.index for question in self.questions], [1, 2, 3])
+        self.assertEqual([question.course_index for question in self.questions], [1, 2, 3])
+        self.assertEqual(self.hidden_question.index, 1)
+        self.assertIsNone(self.hidden_question.course_index)
+
+
+class TestStatsRecord(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.mock_user(save=True)
+        self.question = add_question_boolean(add_exam(add_course()), text="Question")
+
+    def test_first_answer_counts(self):
+        self.assertTrue(models.Stats.record(self.user, self.question, True))
+        self.assertFalse(models.Stats.record(self.user, self.question, False))
+        db.session.commit()
+        self.assertEqual([stat.correct for stat in models.Stats.query], [True])
+
+    def test_after_reset(self):
+        models.Stats.record(self.user, self.question, False)
+        models.Stats.query.update({models.Stats.reset: True})
+        self.assertTrue(models.Stats.record(self.user, self.question, True))
+        db.session.commit()
+        self.assertEqual(models.Stats.query.count(), 2)
@@ -153,9 +153,9 @@ class ResetStatsTest(DatabaseTestCase):
                 question = Question(exam_id=exam.id, type=Question.BOOLEAN, text="Test Question", correct=True)
                 db.session.add(question)
                 db.session.commit()
-                for stats_n in range(2):
-                    stats = Stats(self.user, question, random.choice([True, False]))
-                    db.session.add(stats)
+                # Only one active answer per question
+                stats = Stats(self.user, question, random.choice([True, False]))
+                db.session.add(stats)
         db.session.commit()
 
     def test_reset_exam(self):
@@ -235,6 +235,13 @@ class QuestionTest(DatabaseTestCase):
         response = self.client.get(url_for('quiz.question_course', course_code=question.course.code, id=1))
         self.assert200(response)
 
+    @patch('memorizer.views.quiz.utils.random_id', return_value=1)
+    def test_exam_random(self, random_patch):
+        exam = self.boolean.exam
+        url = url_for('quiz.question_exam', course_code=self.course.code, exam_name=exam.name, id=1)
+        self.assert200(self.client.get(url))
+        random_patch.assert_called_once_with(id=1, course=self.course.code, exam=exam.name)
+
     def test_answer(self):
         question = self.boolean
         stats_data = generate_stats(question.course.code, question.exam.name)
@@ -281,3 +288,26 @@ class QuestionTest(DatabaseTestCase):
     def post_answer(self, url, answer='true'):
         response = self.client.post(url, data={'answer': answer})
         return response
+
+
+class AnonymousUserTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.course = add_course()
+        exam = add_exam(self.course)
+        self.boolean = Question(exam_id=exam.id, type=Question.BOOLEAN, text="Test Question", correct=True)
+        db.session.add(self.boolean)
+        db.session.commit()
+
+    def test_not_saved_on_read(self):
+        self.assert200(self.client.get(url_for('quiz.main')))
+        self.assert200(self.client.get(url_for('quiz.question_course', course_code=self.course.code, id=1)))
+        self.assertEqual(User.query.count(), 0)
+
+    def test_saved_on_answer(self):
+        url = url_for('quiz.question_course', course_code=self.course.code, id=self.boolean.id)
+        with self.client:
+            self.client.post(url, data={'answer': 'true'})
+            user = User.query.one()
+            self.assertEqual(session['user'], user.id)
+        self.assertEqual(Stats.query.filter_by(user_id=user.id).count(), 1)
@@ -0,0 +1,43 @@
+from unittest.mock import patch
+
+from flask import url_for
+
+from memorizer import serializers
+from tests import DatabaseTestCase
+from tests.models_mock import add_course, add_exam, add_question_boolean, add_question_multiple
+
+
+class SerializerTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.mock_user()
+        self.course = add_course(code="TIØ4258")
+        self.exam = add_exam(self.course)
+
+    def test_request_context_reused(self):
+        context = serializers.request_context()
+        with patch('memorizer.serializers.url_for') as url_for_mock:
+            self.assertIs(serializers.request_context(), context)
+            url_for_mock.assert_not_called()
+        # A new one for another user
+        self.mock_user()
+        self.assertIsNot(serializers.request_context(), context)
+
+    def test_image_url(self):
+        question = add_question_boolean(self.exam, text="Question", image="an image.png")
+        serialized = serializers.question(question, serializers.Context())
+        self.assertEqual(serialized['image'], url_for('static', filename='img/TIØ4258/an image.png'))
+        question.image = 'http://example.com/image.png'
+        self.assertEqual(serializers.question(question, serializers.Context())['image'], question.image)
+
+    def test_hidden(self):
+        question = add_question_multiple(self.exam, text="Question", alternatives=[('Alt 1', True)])
+        self.exam.hidden = True
+        self.assertIsNone(serializers.question(question, serializers.Context(self.user)))
+        self.assertIsNone(serializers.exam(self.exam, serializers.Context(self.user)))
+        self.user.admin = True
+        serialized = serializers.question(question, serializers.Context(self.user))
+        self.assertEqual(
+            serialized['alternatives'], [{'id': question.alternatives[0].id, 'text': 'Alt 1', 'correct': True}]
+        )
+        self.assertEqual(serializers.exam(self.exam, serializers.Context(self.user))['id'], self.exam.id)
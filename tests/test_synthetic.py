@@ -0,0 +1,56 @@
+import random
+
+from click.testing import CliRunner
+
+from memorizer import models
+from memorizer.database import db
+from memorizer.synthetic import add_students, generate_synthetic
+from tests import DatabaseTestCase
+from tests.models_mock import add_course, add_exam, add_question_boolean
+
+
+class GenerateSyntheticTest(DatabaseTestCase):
+    def invoke(self, *options, **kwargs):
+        options = ['--courses', '2', '--questions', '40', '--questions-per-exam', '5', '--users', '4',
+                   '--stats', '60', '--steps', '2', '--iterations', '2'] + list(options)
+        return CliRunner().invoke(generate_synthetic, options, **kwargs)
+
+    def test_generate(self):
+        result = self.invoke()
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(models.Course.query.count(), 2)
+        self.assertEqual(models.Exam.query.count(), 8)
+        self.assertEqual(models.Question.query.count(), 40)
+        self.assertEqual(models.User.query.count(), 4)
+        # Answering while measuring adds a few more
+        self.assertGreaterEqual(models.Stats.query.count(), 60)
+        # One row per size
+        self.assertIn('Median ms per request', result.output)
+        self.assertIn('      40         4          60', result.output)
+
+    def test_answers_distinct(self):
+        self.invoke()
+        pairs = db.session.query(models.Stats.user_id, models.Stats.question_id).filter_by(reset=False).all()
+        self.assertEqual(len(pairs), len(set(pairs)))
+
+    def test_confirm(self):
+        self.invoke()
+        result = self.invoke(input='n\n')
+        self.assertNotEqual(result.exit_code, 0)
+        self.assertEqual(models.Course.query.count(), 2)
+        result = self.invoke('--yes')
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(models.Course.query.count(), 4)
+
+
+class AddStudentsTest(DatabaseTestCase):
+    def test_add_students(self):
+        exam = add_exam(add_course())
+        question_ids = {exam.course_id: [add_question_boolean(exam, "Question %d" % i).id for i in range(3)]}
+        user_ids, answers = add_students(question_ids, 2, 10, random.Random(0), reset_share=0)
+        db.session.commit()
+        self.assertEqual(models.User.query.count(), 2)
+        # At most one answer per question and user
+        self.assertEqual(answers, 6)
+        stats = models.Stats.query.filter(models.Stats.user_id.in_(user_ids))
+        self.assertEqual(stats.filter_by(reset=False).count(), 6)
@@ -0,0 +1,114 @@
+from unittest import TestCase
+
+from memorizer import utils
+from memorizer.cache import cache
+from memorizer.database import db
+from memorizer.models import Stats
+from tests import DatabaseTestCase
+from tests.models_mock import add_course, add_exam, add_question_boolean
+
+
+class AnsweredSetTest(TestCase):
+    def test_add(self):
+        answered = utils.AnsweredSet(10)
+        answered.add(3)
+        answered.add(3)
+        answered.add(10)
+        self.assertIn(3, answered)
+        self.assertIn(10, answered)
+        self.assertNotIn(4, answered)
+        self.assertEqual(len(answered), 2)
+
+    def test_random_unanswered(self):
+        answered = utils.AnsweredSet(20)
+        for position in range(1, 21):
+            if position != 17:
+                answered.add(position)
+        for _ in range(10):
+            self.assertEqual(answered.random_unanswered(), 17)
+        self.assertIsNone(answered.random_unanswered(exclude=17))
+
+    def test_all_answered(self):
+        answered = utils.AnsweredSet(2)
+        answered.add(1)
+        answered.add(2)
+        self.assertIsNone(answered.random_unanswered())
+
+
+class RandomIdTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = self.mock_user(save=True)
+        self.course = add_course()
+        self.exam = add_exam(self.course)
+        self.questions = [add_question_boolean(self.exam, text="Question %d" % i) for i in range(3)]
+
+    def answer(self, question):
+        db.session.add(Stats(self.user, question, True))
+        db.session.commit()
+        utils.mark_answered(self.user, question)
+
+    def test_skips_answered(self):
+        # Build the cached set before answering
+        utils.random_id(course=self.course.code)
+        self.answer(self.questions[0])
+        self.answer(self.questions[2])
+        for _ in range(10):
+            self.assertEqual(utils.random_id(course=self.course.code), 2)
+            self.assertEqual(utils.random_id(course=self.course.code, exam=self.exam.name), 2)
+
+    def test_built_from_stats(self):
+        self.answer(self.questions[1])
+        self.answer(self.questions[2])
+        self.assertEqual(utils.random_id(course=self.course.code), 1)
+
+    def test_concurrent_answers(self):
+        utils.random_id(course=self.course.code)
+        # Another request is updating the sets of the user
+        cache.add('answered-lock/{}'.format(self.user.id), True)
+        self.answer(self.questions[0])
+        cache.delete('answered-lock/{}'.format(self.user.id))
+        self.answer(self.questions[2])
+        for _ in range(10):
+            self.assertEqual(utils.random_id(course=self.course.code), 2)
+
+    def test_clear(self):
+        utils.random_id(course=self.course.code)
+        self.answer(self.questions[0])
+        Stats.query.update({Stats.reset: True})
+        db.session.commit()
+        utils.clear_answered(self.user, self.course)
+        self.assertEqual(len(utils.answered_set(self.user, self.course.code)), 0)
+
+
+class GenerateStatsTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = self.mock_user(save=True)
+        self.course = add_course()
+        self.exam = add_exam(self.course)
+        self.questions = [add_question_boolean(self.exam, text="Question %d" % i) for i in range(4)]
+
+    def add_stats(self, *answers):
+        for question, correct in zip(self.questions, answers):
+            db.session.add(Stats(self.user, question, correct))
+        db.session.commit()
+
+    def test_empty(self):
+        stats = utils.generate_stats(self.course.code)
+        self.assertEqual((stats['total'], stats['points'], stats['combo']), (0, 0, 0))
+        self.assertEqual(stats['grade'], '-')
+
+    def test_combo(self):
+        self.add_stats(True, False, True, True)
+        for stats in (utils.generate_stats(self.course.code), utils.generate_stats(self.course.code, self.exam.name)):
+            self.assertEqual((stats['total'], stats['points'], stats['combo']), (4, 3, 2))
+
+    def test_ignores_reset(self):
+        self.add_stats(True, True)
+        Stats.query.update({Stats.reset: True})
+        self.add_stats(False)
+        stats = utils.generate_stats(self.course.code)
+        self.assertEqual((stats['total'], stats['points'], stats['combo']), (1, 0, 0))